@@ -5,24 +5,291 @@ Authentication module for Ink & Memory.
 Provides JWT token generation/verification and password hashing.
 """
 
-import jwt
+import asyncio
+import base64
+import binascii
 import bcrypt
-from datetime import datetime, timedelta
+import hashlib
+import json
+import hmac
+import logging
+import multiprocessing
+import secrets
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from typing import Optional
 import os
+import time
+
+try:
+    import orjson
+
+    _json_dumps = orjson.dumps
+    _json_loads = orjson.loads
+except ImportError:  # orjson is an optional speed-up
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode('utf-8')
+
+    _json_loads = json.loads
+
+logger = logging.getLogger("auth")
 
 # @@@ JWT Configuration
-SECRET_KEY = os.environ.get("JWT_SECRET_KEY", "dev-secret-change-in-production-123456789")
+_DEV_SECRET_KEY = "dev-secret-change-in-production-123456789"
+SECRET_KEY = os.environ.get("JWT_SECRET_KEY", _DEV_SECRET_KEY)
+if not SECRET_KEY.strip():
+    raise RuntimeError("JWT_SECRET_KEY is set but empty; unset it for local dev or provide a real secret")
+if SECRET_KEY == _DEV_SECRET_KEY:
+    print("⚠️  JWT_SECRET_KEY not set - using the development secret, tokens are forgeable")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
+ACCESS_TOKEN_EXPIRE_SECONDS = ACCESS_TOKEN_EXPIRE_MINUTES * 60
+
+# @@@ HS256 tokens are signed/verified directly with hmac (same wire format
+# as PyJWT); the key bytes and the constant header are prepared once here
+def _b64url_encode(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+def _b64url_decode(data: bytes) -> bytes:
+    return base64.urlsafe_b64decode(data + b"=" * (-len(data) % 4))
+
+_SECRET_KEY_BYTES = SECRET_KEY.encode('utf-8')
+# Keyed HMAC prototype: copy() reuses the derived inner/outer pads per token
+_HMAC_PROTO = hmac.new(_SECRET_KEY_BYTES, digestmod=hashlib.sha256)
+_JWT_HEADER_B64 = _b64url_encode(b'{"alg":"HS256","typ":"JWT"}')
+
+def _hmac_sha256(message: bytes) -> bytes:
+    h = _HMAC_PROTO.copy()
+    h.update(message)
+    return h.digest()
+
+class _InvalidToken(Exception):
+    pass
+
+class _ExpiredToken(Exception):
+    pass
+
+# @@@ bcrypt cost
+BCRYPT_MIN_ROUNDS = 4
+BCRYPT_MAX_ROUNDS = 31
+
+def _calibrate_rounds(target_ms: float) -> int:
+    """
+    Pick the largest bcrypt cost whose single hash stays under a time budget.
+
+    Args:
+        target_ms: Time budget for one hash in milliseconds
+
+    Returns:
+        bcrypt rounds (never below 10, even if 10 already exceeds the budget)
+    """
+    rounds = 10
+    while rounds <= 16:
+        start = time.perf_counter()
+        bcrypt.hashpw(b"x" * 16, bcrypt.gensalt(rounds=rounds))
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if elapsed_ms > target_ms:
+            if rounds == 10:
+                print(f"⚠️  bcrypt budget of {target_ms} ms can't be met "
+                      f"(10 rounds took {elapsed_ms:.0f} ms), using 10 rounds")
+                return 10
+            return rounds - 1
+        rounds += 1
+    return 16
+
+def _load_bcrypt_rounds(environ) -> int:
+    """
+    Resolve the bcrypt cost from BCRYPT_TARGET_MS or BCRYPT_ROUNDS.
+
+    Raises:
+        RuntimeError: If either value is malformed or out of range
+    """
+    target_ms = environ.get("BCRYPT_TARGET_MS")
+    if target_ms:
+        try:
+            target = float(target_ms)
+        except ValueError:
+            raise RuntimeError(f"BCRYPT_TARGET_MS must be a number of milliseconds, got {target_ms!r}")
+        if target <= 0:
+            raise RuntimeError(f"BCRYPT_TARGET_MS must be positive, got {target_ms!r}")
+        rounds = _calibrate_rounds(target)
+        print(f"🔐 bcrypt calibrated to {rounds} rounds ({target_ms} ms budget)")
+        return rounds
+
+    raw = environ.get("BCRYPT_ROUNDS", "12")
+    try:
+        rounds = int(raw)
+    except ValueError:
+        raise RuntimeError(f"BCRYPT_ROUNDS must be an integer, got {raw!r}")
+    if not BCRYPT_MIN_ROUNDS <= rounds <= BCRYPT_MAX_ROUNDS:
+        raise RuntimeError(
+            f"BCRYPT_ROUNDS must be between {BCRYPT_MIN_ROUNDS} and {BCRYPT_MAX_ROUNDS}, got {rounds}"
+        )
+    return rounds
+
+BCRYPT_ROUNDS = _load_bcrypt_rounds(os.environ)
 
 def hash_password(password: str) -> str:
     """Hash a password using bcrypt."""
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
 
-def verify_password(password: str, password_hash: str) -> bool:
-    """Verify a password against its hash."""
-    return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+def needs_rehash(password_hash: bytes) -> bool:
+    """Check (from the $2b$NN$ prefix) whether a hash uses fewer rounds than BCRYPT_ROUNDS."""
+    try:
+        return int(password_hash[4:6]) < BCRYPT_ROUNDS
+    except ValueError:
+        return False
+
+def rehash_if_needed(password: bytes, password_hash: bytes) -> Optional[str]:
+    """
+    Rehash a verified password if its hash uses fewer rounds than BCRYPT_ROUNDS.
+
+    Args:
+        password: UTF-8 encoded password that already passed verify_password
+        password_hash: Stored bcrypt hash ($2b$NN$...)
+
+    Returns:
+        New hash string, or None if the stored hash is up to date
+    """
+    if not needs_rehash(password_hash):
+        return None
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode('utf-8')
+
+# @@@ Verified-credentials cache
+# Remembers successful checks for a short time so repeated logins with the
+# same credentials skip bcrypt. Keys are HMAC(pepper, password || hash), so
+# neither plaintext nor an unsalted digest of it is kept in memory. The
+# pepper is AUTH_PEPPER or a per-process random key. VERIFY_CACHE_SIZE=0
+# turns the cache off.
+def _env_int(name: str, default: int) -> int:
+    raw = os.environ.get(name, str(default))
+    try:
+        value = int(raw)
+    except ValueError:
+        raise RuntimeError(f"{name} must be an integer, got {raw!r}")
+    if value < 0:
+        raise RuntimeError(f"{name} must not be negative, got {value}")
+    return value
+
+VERIFY_CACHE_SIZE = _env_int("VERIFY_CACHE_SIZE", 4096)
+VERIFY_CACHE_TTL_SECONDS = _env_int("VERIFY_CACHE_TTL_SECONDS", 60)
+_PEPPER = os.environ.get("AUTH_PEPPER", "").encode('utf-8') or secrets.token_bytes(32)
+_verified: "OrderedDict[bytes, float]" = OrderedDict()
+_verified_lock = threading.Lock()
+
+def _verify_cache_key(password: bytes, password_hash: bytes) -> Optional[bytes]:
+    if VERIFY_CACHE_SIZE <= 0 or VERIFY_CACHE_TTL_SECONDS <= 0:
+        return None
+    return hmac.new(_PEPPER, password + b"\0" + password_hash, hashlib.sha256).digest()
+
+def _is_verified(key: Optional[bytes]) -> bool:
+    if key is None:
+        return False
+    with _verified_lock:
+        verified_at = _verified.get(key)
+        if verified_at is None:
+            return False
+        if time.monotonic() - verified_at >= VERIFY_CACHE_TTL_SECONDS:
+            del _verified[key]
+            return False
+        return True
+
+def _remember_verified(key: Optional[bytes]):
+    if key is None:
+        return
+    with _verified_lock:
+        _verified[key] = time.monotonic()
+        _verified.move_to_end(key)
+        while len(_verified) > VERIFY_CACHE_SIZE:
+            _verified.popitem(last=False)
+
+def clear_verify_cache():
+    """Forget all cached successful verifications (e.g. after a password change)."""
+    with _verified_lock:
+        _verified.clear()
+
+def _checkpw(password: bytes, password_hash: bytes) -> bool:
+    try:
+        # hashpw with the stored hash as salt reproduces the hash on a match
+        return hmac.compare_digest(bcrypt.hashpw(password, password_hash), password_hash)
+    except ValueError:
+        # Malformed stored hash ("Invalid salt")
+        return False
+
+def verify_password(password: bytes, password_hash: bytes) -> bool:
+    """
+    Verify a password against its hash.
+
+    Args:
+        password: UTF-8 encoded password
+        password_hash: bcrypt hash as stored for the user, encoded to bytes
+
+    Returns:
+        True if the password matches, False otherwise (including malformed hashes)
+    """
+    key = _verify_cache_key(password, password_hash)
+    if _is_verified(key):
+        return True
+    if not _checkpw(password, password_hash):
+        return False
+    _remember_verified(key)
+    return True
+
+# @@@ bcrypt process pool for async callers
+# bcrypt is CPU-bound by design. The server starts a small dedicated pool
+# (start_bcrypt_pool, BCRYPT_POOL_WORKERS=0 disables it) so login bursts
+# don't occupy the shared request threadpool; without it the async helpers
+# fall back to a thread.
+BCRYPT_POOL_WORKERS = _env_int("BCRYPT_POOL_WORKERS", min(4, os.cpu_count() or 1))
+_bcrypt_pool: Optional[ProcessPoolExecutor] = None
+
+def start_bcrypt_pool():
+    """Start and warm up the bcrypt worker processes (called from app startup)."""
+    global _bcrypt_pool
+    if _bcrypt_pool is None and BCRYPT_POOL_WORKERS > 0:
+        # spawn, not fork: the server process already runs threads by now.
+        # Workers only run bcrypt's own functions, so they never import this module.
+        _bcrypt_pool = ProcessPoolExecutor(
+            max_workers=BCRYPT_POOL_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        # Pay the process start-up cost here instead of on the first login
+        for future in [_bcrypt_pool.submit(bcrypt.gensalt, 4) for _ in range(BCRYPT_POOL_WORKERS)]:
+            future.result()
+        print(f"🔐 bcrypt pool started ({BCRYPT_POOL_WORKERS} workers)")
+
+def shutdown_bcrypt_pool():
+    """Stop the bcrypt worker processes (called from app shutdown)."""
+    global _bcrypt_pool
+    if _bcrypt_pool is not None:
+        _bcrypt_pool.shutdown(wait=True)
+        _bcrypt_pool = None
+
+async def _run_bcrypt(func, *args):
+    if _bcrypt_pool is None:
+        # bcrypt releases the GIL, so a thread still keeps the loop free
+        return await asyncio.to_thread(func, *args)
+    return await asyncio.get_running_loop().run_in_executor(_bcrypt_pool, func, *args)
+
+async def ahash_password(password: str) -> str:
+    """Async version of hash_password (runs in the bcrypt pool)."""
+    hashed = await _run_bcrypt(bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt(rounds=BCRYPT_ROUNDS))
+    return hashed.decode('utf-8')
+
+async def averify_password(password: bytes, password_hash: bytes) -> bool:
+    """Async version of verify_password (runs in the bcrypt pool)."""
+    key = _verify_cache_key(password, password_hash)
+    if _is_verified(key):
+        return True
+    try:
+        if not await _run_bcrypt(bcrypt.checkpw, password, password_hash):
+            return False
+    except ValueError:
+        # Malformed stored hash ("Invalid salt")
+        return False
+    _remember_verified(key)
+    return True
 
 def create_access_token(user_id: int, email: str) -> str:
     """
@@ -35,17 +302,54 @@ def create_access_token(user_id: int, email: str) -> str:
     Returns:
         JWT token string
     """
-    expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    now = int(time.time())
 
     payload = {
         "sub": str(user_id),  # Subject: user ID
         "email": email,
-        "exp": expire,  # Expiration time
-        "iat": datetime.utcnow()  # Issued at
+        "exp": now + ACCESS_TOKEN_EXPIRE_SECONDS,  # Expiration time
+        "iat": now  # Issued at
     }
 
-    token = jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
-    return token
+    signing_input = _JWT_HEADER_B64 + b"." + _b64url_encode(_json_dumps(payload))
+    signature = _hmac_sha256(signing_input)
+    return (signing_input + b"." + _b64url_encode(signature)).decode('ascii')
+
+def _decode_jwt(token: str) -> dict:
+    """Check an HS256 JWT's signature and expiry and return its payload."""
+    try:
+        header_b64, payload_b64, signature_b64 = token.encode('ascii').split(b".")
+        header = _json_loads(_b64url_decode(header_b64))
+        signature = _b64url_decode(signature_b64)
+    except (ValueError, UnicodeEncodeError, binascii.Error) as exc:
+        raise _InvalidToken() from exc
+    if not isinstance(header, dict) or header.get("alg") != ALGORITHM:
+        raise _InvalidToken()
+
+    expected = _hmac_sha256(header_b64 + b"." + payload_b64)
+    if not hmac.compare_digest(signature, expected):
+        raise _InvalidToken()
+
+    try:
+        payload = _json_loads(_b64url_decode(payload_b64))
+    except (ValueError, binascii.Error) as exc:
+        raise _InvalidToken() from exc
+    if not isinstance(payload, dict):
+        raise _InvalidToken()
+
+    exp = payload.get("exp")
+    if exp is not None:
+        if isinstance(exp, bool) or not isinstance(exp, (int, float)):
+            raise _InvalidToken()
+        if exp <= time.time():
+            raise _ExpiredToken()
+    return payload
+
+def _parse_sub(sub) -> int:
+    """Parse the subject claim; we issue it as str(user_id), i.e. ASCII digits."""
+    if isinstance(sub, str) and sub.isascii() and sub.isdigit():
+        return int(sub, 10)
+    raise ValueError("sub claim is not a user id")
 
 def verify_access_token(token: str) -> Optional[dict]:
     """
@@ -58,8 +362,8 @@ def verify_access_token(token: str) -> Optional[dict]:
         Payload dict with user_id and email, or None if invalid
     """
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = int(payload.get("sub"))
+        payload = _decode_jwt(token)
+        user_id = _parse_sub(payload.get("sub"))
         email = payload.get("email")
 
         if user_id is None or email is None:
@@ -69,11 +373,13 @@ def verify_access_token(token: str) -> Optional[dict]:
             "user_id": user_id,
             "email": email
         }
-    except jwt.ExpiredSignatureError:
-        print("Token expired")
+    except _ExpiredToken:
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Token expired")
         return None
-    except jwt.InvalidTokenError:
-        print("Invalid token")
+    except (_InvalidToken, TypeError, ValueError):
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("Invalid token")
         return None
 
 def extract_token_from_header(authorization: Optional[str]) -> Optional[str]:
@@ -86,11 +392,12 @@ def extract_token_from_header(authorization: Optional[str]) -> Optional[str]:
     Returns:
         Token string or None
     """
-    if not authorization:
+    if not authorization or len(authorization) < 8:
         return None
 
-    parts = authorization.split()
-    if len(parts) != 2 or parts[0].lower() != "bearer":
+    # Prefix check on a slice instead of split(): this runs on every request
+    if authorization[:7].lower() != "bearer ":
         return None
 
-    return parts[1]
+    token = authorization[7:].strip()
+    return token or None
@@ -2,22 +2,46 @@
 
 import json
 import os
+import sys
+from functools import lru_cache
+from pathlib import Path
+from types import MappingProxyType
 from typing import Any, Dict
 
-CONFIG_PATH = os.path.join(os.path.dirname(__file__), "models.json")
+try:
+    import orjson
+
+    _json_loads = orjson.loads
+except ImportError:  # orjson is an optional speed-up
+    _json_loads = json.loads
+
+_BASE_DIR = Path(__file__).resolve().parent
+_PROMPTS_DIR = _BASE_DIR / "prompts"
+CONFIG_PATH = str(_BASE_DIR / "models.json")
+
+
+@lru_cache(maxsize=None)
+def _load_models_config_cached(mtime_ns: int) -> Dict[str, Any]:
+    """Parse models.json; cached per modification time."""
+    with open(CONFIG_PATH, "rb") as f:
+        try:
+            data = _json_loads(f.read())
+        except ValueError as exc:
+            raise RuntimeError(f"models.json is not valid JSON: {exc}") from exc
+    if not isinstance(data, dict):
+        raise RuntimeError("models.json must contain a JSON object at the top level")
+    return data
 
 
 def _load_models_config() -> Dict[str, Any]:
-    """Load configuration from models.json."""
-    if not os.path.exists(CONFIG_PATH):
+    """Load configuration from models.json (re-parsed only when the file changes)."""
+    try:
+        mtime_ns = os.stat(CONFIG_PATH).st_mtime_ns
+    except FileNotFoundError:
         raise RuntimeError(
             "models.json not found; copy backend/models.json.example and fill in your keys"
         )
-    with open(CONFIG_PATH, "r", encoding="utf-8") as f:
-        data = json.load(f)
-    if not isinstance(data, dict):
-        raise RuntimeError("models.json must contain a JSON object at the top level")
-    return data
+    return _load_models_config_cached(mtime_ns)
 
 
 _CONFIG = _load_models_config()
@@ -43,11 +67,18 @@ def _role_model(role: str) -> str:
     return model_name
 
 
-def _resolve_model_config(model_name: str) -> Dict[str, Any]:
+def _get_models() -> Dict[str, Any]:
     models = _CONFIG.get("models")
     if not isinstance(models, dict) or not models:
         raise RuntimeError('models.json must define a non-empty "models" object')
-    entry = models.get(model_name)
+    return models
+
+
+_MODELS = _get_models()
+
+
+def _resolve_model_config(model_name: str) -> Dict[str, Any]:
+    entry = _MODELS.get(model_name)
     if not isinstance(entry, dict):
         raise RuntimeError(
             f'model "{model_name}" not found under "models" in models.json'
@@ -77,6 +108,12 @@ if not IMAGE_API_KEY:
     raise RuntimeError(
         f'api_key missing for image generation model "{IMAGE_GENERATION_MODEL}" in models.json'
     )
+IMAGE_API_KEY_BYTES = IMAGE_API_KEY.encode("ascii")
+# Shared (read-only) headers for image API calls, built once instead of per request
+IMAGE_API_HEADERS = {
+    "Authorization": b"Bearer " + IMAGE_API_KEY_BYTES,
+    "Content-Type": "application/json",
+}
 _IMAGE_API_SECTION = _CONFIG.get("image_api") or {}
 IMAGE_API_ENDPOINT = _IMAGE_MODEL_CONFIG.get("endpoint") or _IMAGE_API_SECTION.get(
     "endpoint"
@@ -89,60 +126,91 @@ if not IMAGE_API_ENDPOINT:
 
 # Retry configuration for image generation
 _IMAGE_RETRY = _CONFIG.get("image_retry") or {}
-IMAGE_RETRY_MAX_ATTEMPTS = _IMAGE_RETRY.get("max_attempts", 3)
-IMAGE_RETRY_BASE_TIMEOUT = _IMAGE_RETRY.get(
+
+
+def _image_retry_int(key: str, default: int, minimum: int = 1) -> int:
+    value = _IMAGE_RETRY.get(key, default)
+    try:
+        value = int(value)
+    except (TypeError, ValueError) as exc:
+        raise RuntimeError(f'image_retry.{key} in models.json must be an integer, got {value!r}') from exc
+    if value < minimum:
+        raise RuntimeError(f"image_retry.{key} in models.json must be >= {minimum}, got {value}")
+    return value
+
+
+IMAGE_RETRY_MAX_ATTEMPTS = _image_retry_int("max_attempts", 3)
+IMAGE_RETRY_BASE_TIMEOUT = _image_retry_int(
     "base_timeout", 90
 )  # First attempt: 90s, then +30s per retry
-IMAGE_RETRY_TIMEOUT_INCREMENT = _IMAGE_RETRY.get("timeout_increment", 30)
-IMAGE_MAX_TOKENS = _IMAGE_RETRY.get("max_tokens", 1000)
-IMAGE_DESCRIPTION_MAX_TOKENS = _IMAGE_RETRY.get("description_max_tokens", 500)
-IMAGE_DESCRIPTION_TIMEOUT = _IMAGE_RETRY.get("description_timeout", 120)
-
-# @@@ Helper function to load voice prompts from files
-def _load_prompt(filename):
-    """Load prompt from prompts/ directory."""
-    prompt_path = os.path.join(os.path.dirname(__file__), "prompts", filename)
+IMAGE_RETRY_TIMEOUT_INCREMENT = _image_retry_int("timeout_increment", 30, minimum=0)
+# Backoff between attempts: base * 2^(attempt-1) seconds, capped, with +-50% jitter
+IMAGE_RETRY_BACKOFF_BASE = _image_retry_int("backoff_base", 2, minimum=0)
+IMAGE_RETRY_BACKOFF_CAP = _image_retry_int("backoff_cap", 30, minimum=0)
+IMAGE_MAX_TOKENS = _image_retry_int("max_tokens", 1000)
+IMAGE_DESCRIPTION_MAX_TOKENS = _image_retry_int("description_max_tokens", 500)
+IMAGE_DESCRIPTION_TIMEOUT = _image_retry_int("description_timeout", 120)
+
+# @@@ Load every voice prompt from prompts/ in one directory scan
+def _load_all_prompts() -> Dict[str, str]:
+    """Load prompts/*.md into a dict keyed by file stem."""
+    prompts = {}
     try:
-        with open(prompt_path, "r", encoding="utf-8") as f:
-            return f.read().strip()
+        with os.scandir(_PROMPTS_DIR) as entries:
+            for entry in entries:
+                if entry.name.endswith(".md") and entry.is_file():
+                    prompts[entry.name[:-3]] = Path(entry.path).read_text(encoding="utf-8").strip()
     except FileNotFoundError:
-        return ""
+        pass
+    return prompts
+
+
+_PROMPTS = _load_all_prompts()
 
 
 # Voice archetypes (Echo system - 5 Chinese voice personas)
 VOICE_ARCHETYPES = {
     "holder": {
         "name": "接纳者 (The Holder)",
-        "systemPrompt": _load_prompt("holder.md"),
+        "systemPrompt": _PROMPTS.get("holder", ""),
         "icon": "heart",
         "color": "pink",
     },
     "starter": {
         "name": "启动者 (The Starter)",
-        "systemPrompt": _load_prompt("starter.md"),
+        "systemPrompt": _PROMPTS.get("starter", ""),
         "icon": "fist",
         "color": "yellow",
     },
     "mirror": {
         "name": "照镜者 (The Mirror)",
-        "systemPrompt": _load_prompt("mirror.md"),
+        "systemPrompt": _PROMPTS.get("mirror", ""),
         "icon": "eye",
         "color": "green",
     },
     "weaver": {
         "name": "连接者 (The Weaver)",
-        "systemPrompt": _load_prompt("weaver.md"),
+        "systemPrompt": _PROMPTS.get("weaver", ""),
         "icon": "compass",
         "color": "purple",
     },
     "absurdist": {
         "name": "幽默者 (The Absurdist)",
-        "systemPrompt": _load_prompt("absurdist.md"),
+        "systemPrompt": _PROMPTS.get("absurdist", ""),
         "icon": "masks",
         "color": "pink",
     },
 }
 
+# @@@ Share the short repeated strings and make the default voices read-only
+for _voice in VOICE_ARCHETYPES.values():
+    _voice["name"] = sys.intern(_voice["name"])
+    _voice["icon"] = sys.intern(_voice["icon"])
+    _voice["color"] = sys.intern(_voice["color"])
+VOICE_ARCHETYPES = MappingProxyType(VOICE_ARCHETYPES)
+# Serialized once for /api/default-voices
+VOICE_ARCHETYPES_JSON = json.dumps(dict(VOICE_ARCHETYPES), ensure_ascii=False)
+
 # @@@ Analysis prompt for LLM
 ANALYSIS_PROMPT_TEMPLATE = """You are analyzing internal dialogue using the voice system from Disco Elysium.
 
@@ -5,17 +5,65 @@ SQLite database setup and migrations for Ink & Memory.
 Schema:
 - users: User accounts (email, password_hash)
 - user_sessions: Editor sessions (editor state JSON)
-- daily_pictures: Generated images (base64)
+- daily_pictures: Generated images (metadata + thumbnail, full image by hash)
+- daily_picture_blobs: Full-size image bytes keyed by SHA-256
 - user_preferences: Voice configs, meta prompts, etc.
+- daily_notes_cache: Per-day concatenated note text (rebuilt after session writes)
 """
 
 import sqlite3
 import os
+import atexit
+import base64
+import binascii
+import hashlib
+import threading
+import zlib
+from functools import lru_cache
+from itertools import groupby
+from operator import itemgetter
 from pathlib import Path
 from datetime import datetime, timedelta
 from typing import Optional, Union
+from uuid import uuid4
+from zoneinfo import ZoneInfo
 import json
 
+import config
+
+try:
+    import orjson
+
+    def _json_dumps(obj) -> str:
+        # @@@ OPT_NON_STR_KEYS: int dict keys stringify like json.dumps instead of raising
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS).decode('utf-8')
+
+    def _json_dumpb(obj) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+
+    _json_loads = orjson.loads
+except ImportError:  # orjson is an optional speed-up
+    # Compact UTF-8 output like orjson: no separator spaces, no \uXXXX escapes for CJK text
+    def _json_dumps(obj) -> str:
+        return json.dumps(obj, separators=(',', ':'), ensure_ascii=False)
+
+    def _json_dumpb(obj) -> bytes:
+        return _json_dumps(obj).encode('utf-8')
+
+    _json_loads = json.loads  # Accepts bytes as well as str
+
+try:
+    import pybase64
+
+    # Same signature and binascii.Error on bad input as base64.b64decode
+    _b64decode = pybase64.b64decode
+    _b64encode = pybase64.b64encode_as_string
+except ImportError:  # pybase64 (SIMD base64 codec) is an optional speed-up
+    _b64decode = base64.b64decode
+
+    def _b64encode(data: bytes) -> str:
+        return base64.b64encode(data).decode('ascii')
+
 # Database location
 DB_DIR = Path(__file__).parent / "data"
 DB_PATH = DB_DIR / "ink-and-memory.db"
@@ -23,121 +71,435 @@ DB_PATH = DB_DIR / "ink-and-memory.db"
 # Ensure data directory exists
 DB_DIR.mkdir(exist_ok=True)
 
+class _PooledConnection(sqlite3.Connection):
+    """
+    Thread-local connection handed out by get_db().
+
+    close() only rolls back an unfinished transaction so the connection (and
+    its page cache) can be reused by the next call on this thread; the real
+    close happens in close_db().
+    """
+
+    def close(self):
+        if self.in_transaction:
+            self.rollback()
+
+    def _really_close(self):
+        super().close()
+
+
+# @@@ One connection per thread, reused across calls
+_local = threading.local()
+
+# Page size for newly created database files (SQLite default is 4096); existing
+# files keep theirs until rebuilt offline with rebuild_db_file()
+PAGE_SIZE = 16384
+
+# Compiled statements kept per connection (sqlite3 default is 128). Constant SQL
+# plus the per-field-set UPDATEs from _update_statement fit without evictions.
+STATEMENT_CACHE_SIZE = 512
+
 def get_db():
-    """Get database connection with WAL mode enabled."""
-    db = sqlite3.connect(DB_PATH)
+    """Get this thread's database connection (WAL mode, opened on first use)."""
+    db = getattr(_local, "db", None)
+    if db is not None:
+        return db
+
+    db = sqlite3.connect(DB_PATH, factory=_PooledConnection, cached_statements=STATEMENT_CACHE_SIZE)
     db.row_factory = sqlite3.Row  # Access columns by name
 
-    # @@@ Enable WAL mode for concurrent reads + 1 write
-    db.execute("PRAGMA journal_mode=WAL")
+    # @@@ Per-connection tuning (journal_mode=WAL is persistent, set in init_db)
     db.execute("PRAGMA foreign_keys=ON")
+    db.execute("PRAGMA synchronous=NORMAL")  # Safe with WAL, fsync only at checkpoints
+    db.execute("PRAGMA cache_size=-64000")  # 64 MB page cache
+    db.execute("PRAGMA temp_store=MEMORY")
+    db.execute("PRAGMA busy_timeout=5000")
+    db.execute("PRAGMA mmap_size=268435456")  # 256 MB
 
+    _local.db = db
     return db
 
+def close_db():
+    """Close this thread's pooled connection (e.g. on shutdown)."""
+    db = getattr(_local, "db", None)
+    if db is not None:
+        _local.db = None
+        db.execute("PRAGMA optimize")
+        db._really_close()
+
+# Scripts (scheduler runs, tools/) exit without the server's shutdown hook
+atexit.register(close_db)
+
 def init_db():
     """Initialize database by creating all tables."""
     db = get_db()
-    create_tables(db)
-    db.commit()
-    db.close()
+    is_new = _is_empty_database(db)
+    if is_new:
+        # @@@ Must precede the first write (WAL switch included); fewer overflow
+        # pages per editor-state BLOB. Existing files keep their page size -
+        # changing it means leaving WAL for a full VACUUM.
+        db.execute(f"PRAGMA page_size={PAGE_SIZE}")
+
+    # @@@ WAL for concurrent reads + 1 write (persisted in the database file)
+    db.execute("PRAGMA journal_mode=WAL")
+
+    if is_new:
+        bootstrap_db(db)
+    else:
+        create_tables_no_indexes(db)
+        db.commit()
+
+        # Schema upgrades + seeding, gated by PRAGMA user_version
+        run_migrations(db)
+
+        # @@@ Indexes last so the initial seed inserts skip B-tree maintenance
+        create_indexes(db)
+        db.commit()
+    db.execute("PRAGMA optimize")
     print(f"✅ Database initialized at {DB_PATH}")
+    db.close()
+
+def optimize_db(full_analyze: bool = False):
+    """
+    Periodic maintenance: refresh planner statistics and checkpoint the WAL.
+
+    PRAGMA optimize only re-analyzes tables whose stats look stale; pass
+    full_analyze=True (nightly) to rebuild every sqlite_stat1 row instead.
+    The PASSIVE checkpoint never blocks readers or writers, it just keeps
+    the -wal file from growing between SQLite's automatic checkpoints.
+    """
+    db = get_db()
+    try:
+        db.execute("ANALYZE" if full_analyze else "PRAGMA optimize")
+        busy, wal_frames, checkpointed = db.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+        return {"busy": bool(busy), "wal_frames": wal_frames, "checkpointed": checkpointed}
+    finally:
+        db.close()
+
+def rebuild_db_file(page_size: int = PAGE_SIZE) -> dict:
+    """
+    Rewrite the database file with VACUUM, applying page_size.
+
+    Offline maintenance - run with the server and scheduler stopped. A WAL
+    database can't change its page size, so this leaves WAL, VACUUMs (a full
+    copy of the file, needing that much free disk) and switches WAL back on.
+
+    Returns:
+        {"old_page_size": int, "page_size": int}
+    """
+    if page_size < 512 or page_size > 65536 or page_size & (page_size - 1):
+        raise ValueError(f"page_size must be a power of two between 512 and 65536, got {page_size}")
+
+    db = get_db()
+    try:
+        old_page_size = db.execute("PRAGMA page_size").fetchone()[0]
+        mode = db.execute("PRAGMA journal_mode=DELETE").fetchone()[0]
+        if mode.lower() != "delete":
+            raise RuntimeError("Database is in use by another connection, stop the server first")
+        try:
+            db.execute(f"PRAGMA page_size={page_size}")
+            db.execute("VACUUM")
+        finally:
+            db.execute("PRAGMA journal_mode=WAL")
+        new_page_size = db.execute("PRAGMA page_size").fetchone()[0]
+        return {"old_page_size": old_page_size, "page_size": new_page_size}
+    finally:
+        db.close()
+
+def _is_empty_database(db) -> bool:
+    """True for a brand-new database file (no tables, user_version 0)."""
+    if db.execute("PRAGMA user_version").fetchone()[0] != 0:
+        return False
+    return db.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'users'"
+    ).fetchone() is None
+
+def bootstrap_db(db):
+    """
+    Build a new database at the latest schema version in one transaction.
+
+    @@@ The CREATE statements already describe the final schema, so a fresh
+    file skips the migration chain: tables, triggers, seed rows, then
+    indexes, and user_version jumps straight to len(MIGRATIONS). One commit,
+    one fsync for the whole bootstrap.
+    """
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        create_tables_no_indexes(db)
+        _create_voice_count_triggers(db)
+        _create_picture_blob_trigger(db)
+        seed_system_decks(db)
+        create_indexes(db)
+        db.execute(f"PRAGMA user_version = {len(MIGRATIONS)}")
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
 
-    # Seed system decks
+# ========== Migrations ==========
+
+def _add_column(db, table: str, column_def: str):
+    """ALTER TABLE ... ADD COLUMN, tolerating a column that already exists."""
+    try:
+        db.execute(f"ALTER TABLE {table} ADD COLUMN {column_def}")
+    except sqlite3.OperationalError as e:
+        if "duplicate column name" not in str(e):
+            raise
+
+def migrate_v1(db):
+    """Columns added after the first release, then seed the system decks."""
+    _add_column(db, "user_preferences", "timezone TEXT")
+    # @@@ Publishing columns for existing decks tables
+    _add_column(db, "decks", "published BOOLEAN DEFAULT 0")
+    _add_column(db, "decks", "author_name TEXT")
+    _add_column(db, "decks", "install_count INTEGER DEFAULT 0")
+    db.commit()
     seed_system_decks()
 
-def create_tables(db):
-    """Create all database tables."""
-    print("📦 Creating database tables...")
+def migrate_v2(db):
+    """Denormalize the enabled-voice count onto decks, maintained by triggers."""
+    _add_column(db, "decks", "voice_count INTEGER DEFAULT 0")
+    _create_voice_count_triggers(db)
 
-    # Users table
+    # Backfill: voices seeded before the triggers existed
     db.execute("""
-    CREATE TABLE IF NOT EXISTS users (
-      id INTEGER PRIMARY KEY AUTOINCREMENT,
-      email TEXT UNIQUE NOT NULL,
-      password_hash TEXT NOT NULL,
-      display_name TEXT,
-      created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    UPDATE decks SET voice_count = (
+      SELECT COUNT(*) FROM voices v WHERE v.deck_id = decks.id AND v.enabled = 1
     )
     """)
+    db.commit()
 
-    # User sessions (editor states)
+def _create_voice_count_triggers(db):
+    """Triggers keeping decks.voice_count in step with enabled voices."""
+    # @@@ Triggers keep decks.voice_count exact for every write path (fork, sync, CRUD, cascades)
     db.execute("""
-    CREATE TABLE IF NOT EXISTS user_sessions (
-      id TEXT PRIMARY KEY,
-      user_id INTEGER NOT NULL,
-      name TEXT,
-      editor_state_json TEXT NOT NULL,
-      created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-      updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-      FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
-    )
+    CREATE TRIGGER IF NOT EXISTS trg_voices_count_insert
+    AFTER INSERT ON voices WHEN NEW.enabled = 1
+    BEGIN
+      UPDATE decks SET voice_count = voice_count + 1 WHERE id = NEW.deck_id;
+    END
     """)
-    db.execute("CREATE INDEX IF NOT EXISTS idx_sessions_user ON user_sessions(user_id)")
-
-    # Daily pictures (generated images) - no UNIQUE constraint, allows multiple per day
     db.execute("""
-    CREATE TABLE IF NOT EXISTS daily_pictures (
-      id INTEGER PRIMARY KEY AUTOINCREMENT,
-      user_id INTEGER NOT NULL,
-      date TEXT NOT NULL,
-      image_base64 TEXT NOT NULL,
-      prompt TEXT,
-      thumbnail_base64 TEXT,
-      created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-      FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
-    )
+    CREATE TRIGGER IF NOT EXISTS trg_voices_count_delete
+    AFTER DELETE ON voices WHEN OLD.enabled = 1
+    BEGIN
+      UPDATE decks SET voice_count = voice_count - 1 WHERE id = OLD.deck_id;
+    END
+    """)
+    db.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_voices_count_update
+    AFTER UPDATE OF enabled, deck_id ON voices
+    WHEN (OLD.enabled = 1) IS NOT (NEW.enabled = 1) OR OLD.deck_id IS NOT NEW.deck_id
+    BEGIN
+      UPDATE decks SET voice_count = voice_count - (OLD.enabled = 1) WHERE id = OLD.deck_id;
+      UPDATE decks SET voice_count = voice_count + (NEW.enabled = 1) WHERE id = NEW.deck_id;
+    END
     """)
-    db.execute("CREATE INDEX IF NOT EXISTS idx_pictures_user_date ON daily_pictures(user_id, date)")
 
-    # User preferences (voice configs, meta prompts, etc.)
+def migrate_v3(db):
+    """Drop single-column indexes superseded by the composites in create_indexes."""
+    db.execute("DROP INDEX IF EXISTS idx_voices_deck")
+    db.execute("DROP INDEX IF EXISTS idx_decks_owner")
+    db.commit()
+
+def migrate_v4(db):
+    """Move full-size pictures out of daily_pictures into daily_picture_blobs."""
+    columns = {row[1] for row in db.execute("PRAGMA table_info(daily_pictures)")}
+    if "image_base64" in columns:
+        # @@@ Table rebuild - SQLite can't drop a NOT NULL column in place
+        db.execute("BEGIN IMMEDIATE")
+        db.execute("ALTER TABLE daily_pictures RENAME TO daily_pictures_v3")
+        _create_daily_pictures_tables(db)
+        rows = db.execute("""
+        SELECT id, user_id, date, image_base64, prompt, thumbnail_base64, created_at
+        FROM daily_pictures_v3
+        """).fetchall()
+        for row in rows:
+            image_hash = _store_picture_blob(db, row['image_base64'], strict=False)
+            db.execute("""
+            INSERT INTO daily_pictures (id, user_id, date, image_hash, prompt, thumbnail, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (row['id'], row['user_id'], row['date'], image_hash, row['prompt'],
+                  _decode_thumbnail(row['thumbnail_base64'], strict=False), row['created_at']))
+        db.execute("DROP TABLE daily_pictures_v3")
+        print(f"🖼️  Moved {len(rows)} pictures to daily_picture_blobs")
+
+    _create_picture_blob_trigger(db)
+    db.commit()
+
+def _create_picture_blob_trigger(db):
+    """Trigger releasing a picture blob with its last referencing row."""
+    # @@@ Drop a blob once the last picture pointing at it is gone (incl. user cascades)
     db.execute("""
-    CREATE TABLE IF NOT EXISTS user_preferences (
-      user_id INTEGER PRIMARY KEY,
-      voice_configs_json TEXT,
-      meta_prompt TEXT,
-      state_config_json TEXT,
-      selected_state TEXT,
-      timezone TEXT,
-      first_login_completed INTEGER DEFAULT 0,
-      updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-      FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
-    )
+    CREATE TRIGGER IF NOT EXISTS trg_picture_blob_release
+    AFTER DELETE ON daily_pictures
+    WHEN NOT EXISTS (SELECT 1 FROM daily_pictures WHERE image_hash = OLD.image_hash)
+    BEGIN
+      DELETE FROM daily_picture_blobs WHERE hash = OLD.image_hash;
+    END
     """)
 
+def migrate_v5(db):
+    """Rebuild decks/voices with ON DELETE SET NULL parent links and owner CHECKs."""
+    parent_fk = [row for row in db.execute("PRAGMA foreign_key_list(voices)") if row[3] == "parent_id"]
+    if parent_fk and parent_fk[0][6] == "SET NULL":
+        return  # Created with the current schema
+
+    # @@@ SQLite can't alter constraints - rebuild (foreign_keys must be off, outside a txn)
+    db.commit()
+    db.execute("PRAGMA foreign_keys=OFF")
     try:
-        db.execute("ALTER TABLE user_preferences ADD COLUMN timezone TEXT")
+        db.execute("BEGIN IMMEDIATE")
+        _create_deck_tables(db, suffix="_new")
+        for table in ("decks", "voices"):
+            columns = ", ".join(row[1] for row in db.execute(f"PRAGMA table_info({table}_new)"))
+            db.execute(f"INSERT INTO {table}_new ({columns}) SELECT {columns} FROM {table}")
+            # Links to sources deleted before the constraint existed
+            db.execute(f"""
+            UPDATE {table}_new SET parent_id = NULL
+            WHERE parent_id IS NOT NULL AND parent_id NOT IN (SELECT id FROM {table}_new)
+            """)
+        db.execute("DROP TABLE voices")
+        db.execute("DROP TABLE decks")
+        db.execute("ALTER TABLE decks_new RENAME TO decks")
+        db.execute("ALTER TABLE voices_new RENAME TO voices")
+        _create_voice_count_triggers(db)  # Dropped along with the old voices table
+        violations = db.execute("PRAGMA foreign_key_check").fetchall()
+        if violations:
+            raise RuntimeError(f"Foreign key violations after decks/voices rebuild: {violations[:5]}")
+        db.commit()
     except Exception:
-        pass
+        db.rollback()
+        raise
+    finally:
+        db.execute("PRAGMA foreign_keys=ON")
+
+def migrate_v6(db):
+    """Rewrite TEXT editor states as UTF-8 BLOBs (the column now holds raw JSON bytes)."""
+    # @@@ No rebuild: a BLOB value is stored as-is whatever the declared column type
+    cursor = db.execute("""
+    UPDATE user_sessions SET editor_state_json = CAST(editor_state_json AS BLOB)
+    WHERE typeof(editor_state_json) = 'text'
+    """)
+    db.commit()
+    if cursor.rowcount:
+        print(f"📝 Converted {cursor.rowcount} editor states to BLOB")
+
+def migrate_v7(db):
+    """Persist the "has non-empty text cell" flag on user_sessions and backfill it."""
+    _add_column(db, "user_sessions", "has_text_content INTEGER DEFAULT 0")
+    flagged = []
+    for row in db.execute("SELECT id, editor_state_json FROM user_sessions"):
+        if not _may_have_text(row['editor_state_json']):
+            continue  # Cheap byte scan rules it out - skip the parse
+        try:
+            if _has_text_content(_json_loads(row['editor_state_json'])):
+                flagged.append((row['id'],))
+        except ValueError:  # Malformed state - leave the flag at 0
+            continue
+    db.executemany("UPDATE user_sessions SET has_text_content = 1 WHERE id = ?", flagged)
+    db.commit()
 
-    # Auth sessions
+def migrate_v8(db):
+    """Replace daily_pictures.thumbnail_base64 TEXT with raw thumbnail BLOBs."""
+    columns = {row[1] for row in db.execute("PRAGMA table_info(daily_pictures)")}
+    if "thumbnail_base64" in columns:
+        db.execute("BEGIN IMMEDIATE")
+        db.execute("ALTER TABLE daily_pictures ADD COLUMN thumbnail BLOB")
+        rows = db.execute("""
+        SELECT id, thumbnail_base64 FROM daily_pictures WHERE thumbnail_base64 IS NOT NULL
+        """).fetchall()
+        db.executemany(
+            "UPDATE daily_pictures SET thumbnail = ? WHERE id = ?",
+            [(_decode_thumbnail(row['thumbnail_base64'], strict=False), row['id']) for row in rows]
+        )
+        db.execute("ALTER TABLE daily_pictures DROP COLUMN thumbnail_base64")
+        print(f"🖼️  Converted {len(rows)} thumbnails to BLOB")
+
+    # Thumbnails that are just a second copy of the full image
     db.execute("""
-    CREATE TABLE IF NOT EXISTS auth_sessions (
-      token TEXT PRIMARY KEY,
-      user_id INTEGER NOT NULL,
-      expires_at DATETIME NOT NULL,
-      created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-      FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
-    )
+    UPDATE daily_pictures SET thumbnail = NULL
+    WHERE thumbnail = (SELECT b.image FROM daily_picture_blobs b WHERE b.hash = image_hash)
     """)
-    db.execute("CREATE INDEX IF NOT EXISTS idx_auth_user ON auth_sessions(user_id)")
+    db.commit()
 
-    # Analysis reports
+def migrate_v9(db):
+    """Replace idx_sessions_user with (user_id, updated_at) and refresh planner stats."""
+    db.execute(_SESSIONS_USER_UPDATED_INDEX)
+    db.execute("DROP INDEX IF EXISTS idx_sessions_user")
+    db.execute("ANALYZE user_sessions")
+    db.commit()
+
+def migrate_v10(db):
+    """Replace idx_pictures_user_date with (user_id, date, created_at)."""
+    db.execute(_PICTURES_USER_DATE_INDEX)
+    db.execute("DROP INDEX IF EXISTS idx_pictures_user_date")
+    db.commit()
+
+def migrate_v11(db):
+    """
+    Add user_sessions.content_hash (digest of the stored editor state).
+
+    No backfill: NULL never matches, so each session's next save writes
+    its state and records the hash.
+    """
+    _add_column(db, "user_sessions", "content_hash BLOB")
+    db.commit()
+
+# Index + 1 is the schema version each migration brings the database to
+MIGRATIONS = [migrate_v1, migrate_v2, migrate_v3, migrate_v4, migrate_v5, migrate_v6, migrate_v7,
+              migrate_v8, migrate_v9, migrate_v10, migrate_v11]
+
+def run_migrations(db) -> int:
+    """Apply pending migrations in order. Returns the resulting user_version."""
+    version = db.execute("PRAGMA user_version").fetchone()[0]
+    for target, migrate in enumerate(MIGRATIONS, start=1):
+        if version < target:
+            print(f"🔧 Migrating database to v{target}...")
+            migrate(db)
+            db.execute(f"PRAGMA user_version = {target}")
+            db.commit()
+            version = target
+    return version
+
+def _create_daily_pictures_tables(db):
+    """
+    Picture metadata + content-addressed image store.
+
+    @@@ Full images live in daily_picture_blobs as raw bytes (not base64), so
+    listing queries never read them and identical images are stored once.
+    Thumbnails are raw bytes too; NULL when the full image is the preview.
+    """
     db.execute("""
-    CREATE TABLE IF NOT EXISTS analysis_reports (
+    CREATE TABLE IF NOT EXISTS daily_picture_blobs (
+      hash TEXT PRIMARY KEY,
+      image BLOB NOT NULL
+    )
+    """)
+    db.execute("""
+    CREATE TABLE IF NOT EXISTS daily_pictures (
       id INTEGER PRIMARY KEY AUTOINCREMENT,
       user_id INTEGER NOT NULL,
-      report_type TEXT NOT NULL,
-      report_data_json TEXT NOT NULL,
-      all_notes_text TEXT,
+      date TEXT NOT NULL,
+      image_hash TEXT NOT NULL REFERENCES daily_picture_blobs (hash),
+      prompt TEXT,
+      thumbnail BLOB,
       created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
       FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
     )
     """)
-    db.execute("CREATE INDEX IF NOT EXISTS idx_reports_user ON analysis_reports(user_id, created_at)")
 
-    # @@@ Decks table - organize voices into themed collections
-    db.execute("""
-    CREATE TABLE IF NOT EXISTS decks (
+def _create_deck_tables(db, suffix: str = ""):
+    """
+    Create the decks and voices tables (named decks{suffix}/voices{suffix}).
+
+    @@@ parent_id links a fork to its source. ON DELETE SET NULL: removing a
+    source (e.g. a published deck/voice) detaches forks instead of failing
+    the delete or wiping other users' copies. CHECK: non-system rows must
+    have an owner, so the owner_id cascade always cleans them up.
+    """
+    db.execute(f"""
+    CREATE TABLE IF NOT EXISTS decks{suffix} (
       id TEXT PRIMARY KEY,
       name TEXT NOT NULL,
       name_zh TEXT,
@@ -156,31 +518,16 @@ def create_tables(db):
       published BOOLEAN DEFAULT 0,
       author_name TEXT,
       install_count INTEGER DEFAULT 0,
+      voice_count INTEGER DEFAULT 0,
       created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
       updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-      FOREIGN KEY (parent_id) REFERENCES decks(id),
+      CHECK (is_system = 1 OR owner_id IS NOT NULL),
+      FOREIGN KEY (parent_id) REFERENCES decks(id) ON DELETE SET NULL,
       FOREIGN KEY (owner_id) REFERENCES users(id) ON DELETE CASCADE
     )
     """)
-    db.execute("CREATE INDEX IF NOT EXISTS idx_decks_owner ON decks(owner_id)")
-
-    # @@@ Migration: Add publishing columns to existing decks table
-    try:
-        db.execute("ALTER TABLE decks ADD COLUMN published BOOLEAN DEFAULT 0")
-    except:
-        pass  # Column already exists
-    try:
-        db.execute("ALTER TABLE decks ADD COLUMN author_name TEXT")
-    except:
-        pass
-    try:
-        db.execute("ALTER TABLE decks ADD COLUMN install_count INTEGER DEFAULT 0")
-    except:
-        pass
-
-    # @@@ Voices table - individual voice personas within decks
-    db.execute("""
-    CREATE TABLE IF NOT EXISTS voices (
+    db.execute(f"""
+    CREATE TABLE IF NOT EXISTS voices{suffix} (
       id TEXT PRIMARY KEY,
       deck_id TEXT NOT NULL,
       name TEXT NOT NULL,
@@ -197,13 +544,100 @@ def create_tables(db):
       order_index INTEGER,
       created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
       updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+      CHECK (is_system = 1 OR owner_id IS NOT NULL),
       FOREIGN KEY (deck_id) REFERENCES decks(id) ON DELETE CASCADE,
-      FOREIGN KEY (parent_id) REFERENCES voices(id),
+      FOREIGN KEY (parent_id) REFERENCES voices(id) ON DELETE SET NULL,
       FOREIGN KEY (owner_id) REFERENCES users(id) ON DELETE CASCADE
     )
     """)
-    db.execute("CREATE INDEX IF NOT EXISTS idx_voices_deck ON voices(deck_id)")
-    db.execute("CREATE INDEX IF NOT EXISTS idx_voices_owner ON voices(owner_id)")
+
+def create_tables_no_indexes(db):
+    """Create all database tables (indexes are built separately by create_indexes)."""
+    print("📦 Creating database tables...")
+
+    # Users table
+    db.execute("""
+    CREATE TABLE IF NOT EXISTS users (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      email TEXT UNIQUE NOT NULL,
+      password_hash TEXT NOT NULL,
+      display_name TEXT,
+      created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+
+    # User sessions (editor states)
+    db.execute("""
+    CREATE TABLE IF NOT EXISTS user_sessions (
+      id TEXT PRIMARY KEY,
+      user_id INTEGER NOT NULL,
+      name TEXT,
+      editor_state_json BLOB NOT NULL,
+      has_text_content INTEGER DEFAULT 0,
+      content_hash BLOB,
+      created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+      updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+      FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+    )
+    """)
+
+    # Per-day concatenated note text, dropped whenever the user's sessions change
+    db.execute("""
+    CREATE TABLE IF NOT EXISTS daily_notes_cache (
+      user_id INTEGER NOT NULL,
+      local_date TEXT NOT NULL,
+      tz TEXT NOT NULL,
+      text TEXT NOT NULL,
+      created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+      PRIMARY KEY (user_id, local_date, tz),
+      FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+    )
+    """)
+
+    # Daily pictures (generated images) - no UNIQUE constraint, allows multiple per day
+    _create_daily_pictures_tables(db)
+
+    # User preferences (voice configs, meta prompts, etc.)
+    db.execute("""
+    CREATE TABLE IF NOT EXISTS user_preferences (
+      user_id INTEGER PRIMARY KEY,
+      voice_configs_json TEXT,
+      meta_prompt TEXT,
+      state_config_json TEXT,
+      selected_state TEXT,
+      timezone TEXT,
+      first_login_completed INTEGER DEFAULT 0,
+      updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+      FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+    )
+    """)
+
+    # Auth sessions
+    db.execute("""
+    CREATE TABLE IF NOT EXISTS auth_sessions (
+      token TEXT PRIMARY KEY,
+      user_id INTEGER NOT NULL,
+      expires_at DATETIME NOT NULL,
+      created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+      FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+    )
+    """)
+
+    # Analysis reports
+    db.execute("""
+    CREATE TABLE IF NOT EXISTS analysis_reports (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      user_id INTEGER NOT NULL,
+      report_type TEXT NOT NULL,
+      report_data_json BLOB NOT NULL,
+      all_notes_text BLOB,
+      created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+      FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE
+    )
+    """)
+
+    # @@@ Decks + voices tables - themed collections of voice personas
+    _create_deck_tables(db)
 
     # @@@ Friendships table - bidirectional friend relationships
     db.execute("""
@@ -219,8 +653,6 @@ def create_tables(db):
       UNIQUE(user_id, friend_id)
     )
     """)
-    db.execute("CREATE INDEX IF NOT EXISTS idx_friendships_user ON friendships(user_id, status)")
-    db.execute("CREATE INDEX IF NOT EXISTS idx_friendships_friend ON friendships(friend_id, status)")
 
     # @@@ Friend invites table - one-time invite codes
     db.execute("""
@@ -235,116 +667,280 @@ def create_tables(db):
       FOREIGN KEY (used_by) REFERENCES users (id) ON DELETE SET NULL
     )
     """)
+
+    print("✅ Tables created")
+
+# @@@ Built after bulk loads: one sorted B-tree build beats per-row maintenance
+_VOICE_INDEXES = {
+    # @@@ (deck_id, enabled, order_index): filter + sort for enabled voices, also serves deck_id lookups
+    "idx_voices_deck_enabled_order": (
+        "CREATE INDEX IF NOT EXISTS idx_voices_deck_enabled_order ON voices(deck_id, enabled, order_index)"
+    ),
+    "idx_voices_owner": "CREATE INDEX IF NOT EXISTS idx_voices_owner ON voices(owner_id)",
+}
+
+# Forks copying more voices than this drop/rebuild the voice indexes around the insert
+BULK_REINDEX_THRESHOLD = 5000
+
+# @@@ Serves every per-user session query: equality on user_id, then updated_at
+# ranges / ORDER BY updated_at DESC straight off the index (backward scan, no sort)
+_SESSIONS_USER_UPDATED_INDEX = """
+CREATE INDEX IF NOT EXISTS idx_sessions_user_updated ON user_sessions(user_id, updated_at)
+"""
+
+# @@@ (user_id, date, created_at): timeline listings scan it backwards for
+# ORDER BY date DESC, and the per-date "latest picture" lookup needs no sort
+_PICTURES_USER_DATE_INDEX = """
+CREATE INDEX IF NOT EXISTS idx_pictures_user_date_created ON daily_pictures(user_id, date, created_at)
+"""
+
+def create_indexes(db):
+    """Create all secondary indexes. Idempotent."""
+    db.execute(_SESSIONS_USER_UPDATED_INDEX)
+    # @@@ Partial + covering: daily activity scans touch only sessions with text
+    db.execute("""
+    CREATE INDEX IF NOT EXISTS idx_sessions_text_updated
+    ON user_sessions(updated_at, user_id) WHERE has_text_content = 1
+    """)
+    db.execute(_PICTURES_USER_DATE_INDEX)
+    db.execute("CREATE INDEX IF NOT EXISTS idx_auth_user ON auth_sessions(user_id)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_reports_user ON analysis_reports(user_id, created_at)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_decks_owner_enabled_order ON decks(owner_id, enabled, order_index)")
+    # @@@ Partial index in store order - get_published_decks needs no sort step
+    db.execute("""
+    CREATE INDEX IF NOT EXISTS idx_decks_published
+    ON decks(install_count DESC, created_at DESC) WHERE published = 1
+    """)
+    db.execute("CREATE INDEX IF NOT EXISTS idx_friendships_user ON friendships(user_id, status)")
+    db.execute("CREATE INDEX IF NOT EXISTS idx_friendships_friend ON friendships(friend_id, status)")
     db.execute("CREATE INDEX IF NOT EXISTS idx_invites_user ON friend_invites(user_id)")
     db.execute("CREATE INDEX IF NOT EXISTS idx_invites_expires ON friend_invites(expires_at)")
+    for statement in _VOICE_INDEXES.values():
+        db.execute(statement)
+
+# @@@ Shared INSERT statements - one text per logical operation, so every call
+# site hits the same sqlite3 statement-cache entry
+_SEED_DECK_SQL = """
+INSERT OR IGNORE INTO decks (id, name, name_zh, name_en, description, description_zh, description_en,
+                             icon, color, is_system, enabled, has_local_changes, order_index)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+_SEED_VOICE_SQL = """
+INSERT OR IGNORE INTO voices (id, deck_id, name, name_zh, name_en, system_prompt,
+                              icon, color, is_system, enabled, has_local_changes, order_index)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1, 1, 0, ?)
+"""
+# Default order_index (append after the user's last deck) computed in the same statement
+_INSERT_DECK_SQL = """
+INSERT INTO decks (id, name, name_zh, name_en, description, description_zh, description_en,
+                   icon, color, is_system, owner_id, enabled, has_local_changes, order_index)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0, ?, 1, 0,
+        COALESCE(?, (SELECT COALESCE(MAX(order_index), 0) + 1 FROM decks WHERE owner_id = ?)))
+RETURNING id
+"""
+# Copies keep a parent_id link to their source (deck/voice fork, deck sync)
+_FORK_DECK_SQL = """
+INSERT INTO decks (id, name, name_zh, name_en, description, description_zh, description_en,
+                   icon, color, is_system, parent_id, owner_id, enabled, has_local_changes, order_index)
+SELECT ?, name, name_zh, name_en, description, description_zh, description_en,
+       icon, color, 0, id, ?, ?, 0, order_index
+FROM decks WHERE id = ?
+RETURNING id
+"""
+# Copy a voice to the end of a deck the caller owns; inserts nothing if the deck
+# isn't theirs or the source is missing (params: new_id, deck_id, owner_id,
+# deck_id, source voice_id, deck_id, owner_id)
+_FORK_VOICE_SQL = """
+INSERT INTO voices (id, deck_id, name, name_zh, name_en, system_prompt,
+                    icon, color, is_system, parent_id, owner_id, enabled, has_local_changes, order_index)
+SELECT ?, ?, v.name, v.name_zh, v.name_en, v.system_prompt,
+       v.icon, v.color, 0, v.id, ?, 1, 0,
+       (SELECT COALESCE(MAX(order_index), 0) + 1 FROM voices WHERE deck_id = ?)
+FROM voices v
+WHERE v.id = ?
+  AND EXISTS (SELECT 1 FROM decks WHERE id = ? AND owner_id = ?)
+"""
 
-    print("✅ Tables created")
+# @@@ Random UUID4 text generated inside SQLite (version nibble 4, variant 8-b),
+# same format as str(uuid4()) so copied rows look like every other id
+_SQL_UUID4 = """(
+  lower(hex(randomblob(4))) || '-' || lower(hex(randomblob(2))) || '-4' ||
+  substr(lower(hex(randomblob(2))), 2) || '-' ||
+  substr('89ab', 1 + (abs(random()) % 4), 1) || substr(lower(hex(randomblob(2))), 2) || '-' ||
+  lower(hex(randomblob(6)))
+)"""
+
+# Copy every voice of a deck (params: target deck_id, owner_id, source deck_id)
+# in one statement - no rows travel through Python
+_COPY_DECK_VOICES_SQL = f"""
+INSERT INTO voices (id, deck_id, name, name_zh, name_en, system_prompt,
+                    icon, color, is_system, parent_id, owner_id, enabled, has_local_changes, order_index)
+SELECT {_SQL_UUID4}, ?, name, name_zh, name_en, system_prompt,
+       icon, color, 0, id, ?, 1, 0, order_index
+FROM voices WHERE deck_id = ?
+ORDER BY order_index
+"""
 
-def seed_system_decks():
-    """Seed system decks and voices. Idempotent - safe to call multiple times."""
-    db = get_db()
+# ========== System deck seed data (evaluated once at import) ==========
+
+# (id, name, name_zh, name_en, description, description_zh, description_en,
+#  icon, color, is_system, enabled, has_local_changes, order_index)
+_SYSTEM_DECKS = (
+    ('introspection_deck', '内省卡组', '内省卡组', 'Introspection Deck',
+     '内心对话原型', '内心对话原型', 'Inner dialogue archetypes',
+     'brain', 'purple', 1, 1, 0, 0),
+    ('scholar_deck', '学者卡组', '学者卡组', 'Scholar Deck',
+     '从学术角度分析思考', '从学术角度分析思考', 'Analyze from academic perspectives',
+     'lightbulb', 'blue', 1, 1, 0, 1),
+    ('philosophy_deck', '哲学卡组', '哲学卡组', 'Philosophy Deck',
+     '不同哲学流派的审视', '不同哲学流派的审视', 'Examine through philosophical lenses',
+     'cloud', 'purple', 1, 1, 0, 2),
+)
+
+def _archetype_voice(voice_id: str, name_zh: str, name_en: str, icon: str, color: str, order: int):
+    """Introspection voice row using the name/prompt from config.VOICE_ARCHETYPES."""
+    archetype = config.VOICE_ARCHETYPES[voice_id]
+    return (voice_id, 'introspection_deck', archetype['name'], name_zh, name_en,
+            archetype['systemPrompt'], icon, color, order)
+
+# (id, deck_id, name, name_zh, name_en, system_prompt, icon, color, order_index)
+_INTROSPECTION_VOICES = (
+    _archetype_voice('holder', '接纳者', 'The Holder', 'heart', 'pink', 0),
+    _archetype_voice('starter', '启动者', 'The Starter', 'fist', 'yellow', 1),
+    _archetype_voice('mirror', '照镜者', 'The Mirror', 'eye', 'green', 2),
+    _archetype_voice('weaver', '连接者', 'The Weaver', 'compass', 'purple', 3),
+    _archetype_voice('absurdist', '幽默者', 'The Absurdist', 'masks', 'pink', 4),
+)
+
+# Scholar voices (placeholder prompts - TODO: write detailed prompts)
+_SCHOLAR_VOICES = (
+    ('linguist', 'scholar_deck', '语言学家', '语言学家', 'Linguist',
+     'Analyze from linguistic structure, semantics, and pragmatics.', 'compass', 'blue', 0),
+    ('painter', 'scholar_deck', '画家', '画家', 'Painter',
+     'Analyze from aesthetics, visual imagery, and mood.', 'eye', 'pink', 1),
+    ('physicist', 'scholar_deck', '物理学家', '物理学家', 'Physicist',
+     'Analyze using physics laws, mechanics, and energy.', 'lightbulb', 'yellow', 2),
+    ('computer_scientist', 'scholar_deck', '计算机科学家', '计算机科学家', 'Computer Scientist',
+     'Analyze using algorithms, data structures, and complexity.', 'brain', 'purple', 3),
+    ('doctor', 'scholar_deck', '医生', '医生', 'Doctor',
+     'Analyze from medical, physiological, and psychological health perspectives.', 'heart', 'pink', 4),
+    ('historian', 'scholar_deck', '历史学家', '历史学家', 'Historian',
+     'Provide historical context, cultural background, and patterns.', 'compass', 'green', 5),
+)
+
+# Philosophy voices (placeholder prompts - TODO: write detailed prompts)
+_PHILOSOPHY_VOICES = (
+    ('stoic', 'philosophy_deck', '斯多葛派', '斯多葛派', 'Stoic',
+     'Emphasize reason, self-control, and acceptance of the uncontrollable.', 'shield', 'blue', 0),
+    ('taoist', 'philosophy_deck', '道家', '道家', 'Taoist',
+     'Emphasize wu-wei (effortless action), natural flow, and simplicity.', 'wind', 'green', 1),
+    ('existentialist', 'philosophy_deck', '存在主义者', '存在主义者', 'Existentialist',
+     'Emphasize choice, freedom, responsibility, and creating meaning.', 'question', 'purple', 2),
+    ('pragmatist', 'philosophy_deck', '实用主义者', '实用主义者', 'Pragmatist',
+     'Focus on practical effects, usefulness, and real-world results.', 'fist', 'yellow', 3),
+)
+
+_SYSTEM_VOICES = _INTROSPECTION_VOICES + _SCHOLAR_VOICES + _PHILOSOPHY_VOICES
+
+def seed_system_decks(db=None):
+    """
+    Seed system decks and voices. Idempotent - safe to call multiple times.
 
-    # Check if already seeded
-    existing = db.execute("SELECT COUNT(*) FROM decks WHERE is_system = 1").fetchone()[0]
-    if existing > 0:
-        print("⏭️  System decks already seeded, skipping")
-        db.close()
-        return
+    Runs from bootstrap_db and migrate_v1; INSERT OR IGNORE keeps it safe on
+    databases that were seeded before user_version tracking existed.
+
+    Args:
+        db: Connection with an open transaction to seed inside (the caller
+            commits). When omitted, seeding runs in its own transaction.
+    """
+    owns_db = db is None
+    if owns_db:
+        db = get_db()
 
     print("🌱 Seeding system decks...")
+    if owns_db:
+        db.execute("BEGIN IMMEDIATE")
 
-    # ========== Deck 1: Introspection Deck ==========
-    db.execute("""
-    INSERT INTO decks (id, name, name_zh, name_en, description, description_zh, description_en, icon, color, is_system, enabled, has_local_changes, order_index)
-    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, ('introspection_deck', '内省卡组', '内省卡组', 'Introspection Deck',
-          '内心对话原型', '内心对话原型', 'Inner dialogue archetypes',
-          'brain', 'purple', 1, 1, 0, 0))
-
-    # Import config to get existing voice prompts
-    import config
-
-    # Introspection voices (from existing VOICE_ARCHETYPES)
-    introspection_voices = [
-        ('holder', config.VOICE_ARCHETYPES['holder']['name'], '接纳者', 'The Holder',
-         config.VOICE_ARCHETYPES['holder']['systemPrompt'], 'heart', 'pink', 0),
-        ('starter', config.VOICE_ARCHETYPES['starter']['name'], '启动者', 'The Starter',
-         config.VOICE_ARCHETYPES['starter']['systemPrompt'], 'fist', 'yellow', 1),
-        ('mirror', config.VOICE_ARCHETYPES['mirror']['name'], '照镜者', 'The Mirror',
-         config.VOICE_ARCHETYPES['mirror']['systemPrompt'], 'eye', 'green', 2),
-        ('weaver', config.VOICE_ARCHETYPES['weaver']['name'], '连接者', 'The Weaver',
-         config.VOICE_ARCHETYPES['weaver']['systemPrompt'], 'compass', 'purple', 3),
-        ('absurdist', config.VOICE_ARCHETYPES['absurdist']['name'], '幽默者', 'The Absurdist',
-         config.VOICE_ARCHETYPES['absurdist']['systemPrompt'], 'masks', 'pink', 4),
-    ]
+    db.executemany(_SEED_DECK_SQL, _SYSTEM_DECKS)
+    # @@@ All system voices in one prepared statement
+    db.executemany(_SEED_VOICE_SQL, _SYSTEM_VOICES)
 
-    for voice_id, name, name_zh, name_en, prompt, icon, color, order in introspection_voices:
-        db.execute("""
-        INSERT INTO voices (id, deck_id, name, name_zh, name_en, system_prompt, icon, color, is_system, enabled, has_local_changes, order_index)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0, ?)
-        """, (voice_id, 'introspection_deck', name, name_zh, name_en, prompt, icon, color, 1, 1, order))
+    if owns_db:
+        db.commit()
+        db.close()
+    print(f"✅ System decks seeded ({len(_SYSTEM_DECKS)} decks, {len(_SYSTEM_VOICES)} voices)")
 
-    # ========== Deck 2: Scholar Deck ==========
-    db.execute("""
-    INSERT INTO decks (id, name, name_zh, name_en, description, description_zh, description_en, icon, color, is_system, enabled, has_local_changes, order_index)
-    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, ('scholar_deck', '学者卡组', '学者卡组', 'Scholar Deck',
-          '从学术角度分析思考', '从学术角度分析思考', 'Analyze from academic perspectives',
-          'lightbulb', 'blue', 1, 1, 0, 1))
-
-    # Scholar voices (placeholder prompts - TODO: write detailed prompts)
-    scholar_voices = [
-        ('linguist', '语言学家', '语言学家', 'Linguist',
-         'Analyze from linguistic structure, semantics, and pragmatics.', 'compass', 'blue', 0),
-        ('painter', '画家', '画家', 'Painter',
-         'Analyze from aesthetics, visual imagery, and mood.', 'eye', 'pink', 1),
-        ('physicist', '物理学家', '物理学家', 'Physicist',
-         'Analyze using physics laws, mechanics, and energy.', 'lightbulb', 'yellow', 2),
-        ('computer_scientist', '计算机科学家', '计算机科学家', 'Computer Scientist',
-         'Analyze using algorithms, data structures, and complexity.', 'brain', 'purple', 3),
-        ('doctor', '医生', '医生', 'Doctor',
-         'Analyze from medical, physiological, and psychological health perspectives.', 'heart', 'pink', 4),
-        ('historian', '历史学家', '历史学家', 'Historian',
-         'Provide historical context, cultural background, and patterns.', 'compass', 'green', 5),
-    ]
+# ========== Deck CRUD ==========
 
-    for voice_id, name, name_zh, name_en, prompt, icon, color, order in scholar_voices:
-        db.execute("""
-        INSERT INTO voices (id, deck_id, name, name_zh, name_en, system_prompt, icon, color, is_system, enabled, has_local_changes, order_index)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0, ?)
-        """, (voice_id, 'scholar_deck', name, name_zh, name_en, prompt, icon, color, 1, 1, order))
+# @@@ Explicit column lists: the API shape, fetched as plain tuples
+_DECK_COLUMNS = ('id', 'name', 'name_zh', 'name_en', 'description', 'description_zh',
+                 'description_en', 'icon', 'color', 'is_system', 'parent_id', 'owner_id',
+                 'enabled', 'has_local_changes', 'order_index', 'published', 'author_name',
+                 'install_count', 'created_at', 'updated_at')
+_VOICE_COLUMNS = ('id', 'deck_id', 'name', 'name_zh', 'name_en', 'system_prompt', 'icon',
+                  'color', 'is_system', 'parent_id', 'owner_id', 'enabled', 'has_local_changes',
+                  'order_index', 'created_at', 'updated_at')
 
-    # ========== Deck 3: Philosophy Deck ==========
-    db.execute("""
-    INSERT INTO decks (id, name, name_zh, name_en, description, description_zh, description_en, icon, color, is_system, enabled, has_local_changes, order_index)
-    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, ('philosophy_deck', '哲学卡组', '哲学卡组', 'Philosophy Deck',
-          '不同哲学流派的审视', '不同哲学流派的审视', 'Examine through philosophical lenses',
-          'cloud', 'purple', 1, 1, 0, 2))
-
-    # Philosophy voices (placeholder prompts - TODO: write detailed prompts)
-    philosophy_voices = [
-        ('stoic', '斯多葛派', '斯多葛派', 'Stoic',
-         'Emphasize reason, self-control, and acceptance of the uncontrollable.', 'shield', 'blue', 0),
-        ('taoist', '道家', '道家', 'Taoist',
-         'Emphasize wu-wei (effortless action), natural flow, and simplicity.', 'wind', 'green', 1),
-        ('existentialist', '存在主义者', '存在主义者', 'Existentialist',
-         'Emphasize choice, freedom, responsibility, and creating meaning.', 'question', 'purple', 2),
-        ('pragmatist', '实用主义者', '实用主义者', 'Pragmatist',
-         'Focus on practical effects, usefulness, and real-world results.', 'fist', 'yellow', 3),
-    ]
+_DECK_SELECT = ", ".join(f"d.{column}" for column in _DECK_COLUMNS)
 
-    for voice_id, name, name_zh, name_en, prompt, icon, color, order in philosophy_voices:
-        db.execute("""
-        INSERT INTO voices (id, deck_id, name, name_zh, name_en, system_prompt, icon, color, is_system, enabled, has_local_changes, order_index)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 0, ?)
-        """, (voice_id, 'philosophy_deck', name, name_zh, name_en, prompt, icon, color, 1, 1, order))
+_DECK_LIST_KEYS = _DECK_COLUMNS + ('voice_count',)
+_PUBLISHED_DECK_KEYS = _DECK_LIST_KEYS + ('author_display_name',)
 
-    db.commit()
-    db.close()
-    print("✅ System decks seeded (3 decks, 15 voices)")
+def _deck_with_voices_sql() -> str:
+    """
+    Deck row + its voice rows in one UNION ALL, tagged 'd'/'v' in column 1.
 
-# ========== Deck CRUD ==========
+    Both halves are NULL-padded to the same width. Sorting on the tag puts the
+    deck first; the voices follow in order_index, created_at order.
+    """
+    width = max(len(_DECK_COLUMNS), len(_VOICE_COLUMNS))
+    deck_part = [f"d.{column}" for column in _DECK_COLUMNS] + ["NULL"] * (width - len(_DECK_COLUMNS))
+    voice_part = [f"v.{column}" for column in _VOICE_COLUMNS] + ["NULL"] * (width - len(_VOICE_COLUMNS))
+    order_pos = 2 + _VOICE_COLUMNS.index('order_index')
+    created_pos = 2 + _VOICE_COLUMNS.index('created_at')
+    return f"""
+    SELECT 'd', {", ".join(deck_part)} FROM decks d
+    WHERE d.id = ? AND d.owner_id = ?
+    UNION ALL
+    SELECT 'v', {", ".join(voice_part)} FROM voices v
+    WHERE v.deck_id = ?
+    ORDER BY 1, {order_pos}, {created_pos}
+    """
+
+_DECK_WITH_VOICES_SQL = _deck_with_voices_sql()
+
+# Fields update_deck/update_voice accept, in the fixed order their SET clauses use
+_DECK_UPDATE_FIELDS = ('name', 'name_zh', 'name_en', 'description', 'description_zh',
+                       'description_en', 'icon', 'color', 'enabled', 'order_index')
+_DECK_CONTENT_FIELDS = frozenset(('name', 'name_zh', 'name_en', 'description', 'description_zh',
+                                  'description_en', 'icon', 'color'))
+_VOICE_UPDATE_FIELDS = ('name', 'name_zh', 'name_en', 'system_prompt',
+                        'icon', 'color', 'enabled', 'order_index')
+_VOICE_CONTENT_FIELDS = frozenset(('name', 'name_zh', 'name_en', 'system_prompt',
+                                   'icon', 'color'))
+
+@lru_cache(maxsize=None)
+def _update_statement(table: str, fields: tuple, content_fields: frozenset) -> str:
+    """
+    UPDATE template for one combination of fields, built once per combination.
+    Parameters: the field values in order, then id, then owner_id.
+
+    @@@ Stable SQL text per field set, so sqlite3's statement cache reuses the
+    prepared statement instead of re-parsing on every PATCH.
+    """
+    assignments = [f"{field} = ?" for field in fields]
+    # @@@ Mark as locally changed if content fields are modified
+    if not content_fields.isdisjoint(fields):
+        assignments.append("has_local_changes = 1")
+    assignments.append("updated_at = CURRENT_TIMESTAMP")
+    # @@@ Ownership checked in the WHERE clause - callers test rowcount
+    return f"UPDATE {table} SET {', '.join(assignments)} WHERE id = ? AND owner_id = ?"
+
+def _fetch_tuples(db, sql: str, params=()):
+    """Run a query returning plain tuples (skips sqlite3.Row per-column lookups)."""
+    cursor = db.cursor()
+    cursor.row_factory = None
+    return cursor.execute(sql, params).fetchall()
 
 def get_user_decks(user_id: int):
     """
@@ -355,15 +951,14 @@ def get_user_decks(user_id: int):
     """
     db = get_db()
     try:
-        rows = db.execute("""
-        SELECT d.*, COUNT(v.id) as voice_count
+        # @@@ voice_count is denormalized (see migrate_v2) - no JOIN/GROUP BY
+        rows = _fetch_tuples(db, f"""
+        SELECT {_DECK_SELECT}, d.voice_count
         FROM decks d
-        LEFT JOIN voices v ON d.id = v.deck_id AND v.enabled = 1
         WHERE d.owner_id = ?
-        GROUP BY d.id
         ORDER BY d.order_index, d.created_at
-        """, (user_id,)).fetchall()
-        return [dict(row) for row in rows]
+        """, (user_id,))
+        return [dict(zip(_DECK_LIST_KEYS, row)) for row in rows]
     finally:
         db.close()
 
@@ -374,16 +969,14 @@ def get_published_decks():
     """
     db = get_db()
     try:
-        rows = db.execute("""
-        SELECT d.*, COUNT(v.id) as voice_count, u.display_name as author_display_name
+        rows = _fetch_tuples(db, f"""
+        SELECT {_DECK_SELECT}, d.voice_count, u.display_name as author_display_name
         FROM decks d
-        LEFT JOIN voices v ON d.id = v.deck_id AND v.enabled = 1
         LEFT JOIN users u ON d.owner_id = u.id
         WHERE d.published = 1
-        GROUP BY d.id
         ORDER BY d.install_count DESC, d.created_at DESC
-        """).fetchall()
-        return [dict(row) for row in rows]
+        """)
+        return [dict(zip(_PUBLISHED_DECK_KEYS, row)) for row in rows]
     finally:
         db.close()
 
@@ -448,25 +1041,14 @@ def get_deck_with_voices(user_id: int, deck_id: str):
     """
     db = get_db()
     try:
-        # Get deck (must be user's own)
-        deck_row = db.execute("""
-        SELECT * FROM decks
-        WHERE id = ? AND owner_id = ?
-        """, (deck_id, user_id)).fetchone()
+        # @@@ One round-trip: deck (must be user's own) + its voices
+        rows = _fetch_tuples(db, _DECK_WITH_VOICES_SQL, (deck_id, user_id, deck_id))
 
-        if not deck_row:
+        if not rows or rows[0][0] != 'd':
             return None
 
-        deck = dict(deck_row)
-
-        # Get voices in this deck
-        voice_rows = db.execute("""
-        SELECT * FROM voices
-        WHERE deck_id = ?
-        ORDER BY order_index, created_at
-        """, (deck_id,)).fetchall()
-
-        deck['voices'] = [dict(row) for row in voice_rows]
+        deck = dict(zip(_DECK_COLUMNS, rows[0][1:]))
+        deck['voices'] = [dict(zip(_VOICE_COLUMNS, row[1:])) for row in rows[1:]]
         return deck
     finally:
         db.close()
@@ -479,29 +1061,15 @@ def create_deck(user_id: int, name: str, description: str = None,
     """
     Create a new user deck. Returns deck_id.
     """
-    import uuid
-
     db = get_db()
     try:
-        deck_id = str(uuid.uuid4())
-
-        # Get max order_index if not provided
-        if order_index is None:
-            max_order = db.execute(
-                "SELECT MAX(order_index) as max_order FROM decks WHERE owner_id = ?",
-                (user_id,)
-            ).fetchone()['max_order']
-            order_index = (max_order or 0) + 1
-
-        db.execute("""
-        INSERT INTO decks (id, name, name_zh, name_en, description, description_zh, description_en,
-                          icon, color, is_system, owner_id, enabled, has_local_changes, order_index)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0, ?, 1, 0, ?)
-        """, (deck_id, name, name_zh, name_en, description, description_zh, description_en,
-              icon, color, user_id, order_index))
+        # @@@ One statement: default order_index + insert (no MAX-then-INSERT race)
+        rows = db.execute(_INSERT_DECK_SQL, (
+              str(uuid4()), name, name_zh, name_en, description, description_zh, description_en,
+              icon, color, user_id, order_index, user_id)).fetchall()
 
         db.commit()
-        return deck_id
+        return rows[0]['id']
     finally:
         db.close()
 
@@ -515,48 +1083,23 @@ def update_deck(user_id: int, deck_id: str, updates: dict) -> bool:
 
     @@@ Content changes (name, description, icon, color) → has_local_changes = 1
     @@@ Preference changes (enabled, order_index) → don't affect has_local_changes
-    """
-    db = get_db()
-    try:
-        # Check ownership
-        deck = db.execute(
-            "SELECT owner_id FROM decks WHERE id = ?",
-            (deck_id,)
-        ).fetchone()
-
-        if not deck or deck['owner_id'] != user_id:
-            return False
-
-        # Build update query
-        allowed_fields = ['name', 'name_zh', 'name_en', 'description', 'description_zh',
-                         'description_en', 'icon', 'color', 'enabled', 'order_index']
-        content_fields = ['name', 'name_zh', 'name_en', 'description', 'description_zh',
-                         'description_en', 'icon', 'color']
-
-        update_fields = []
-        params = []
-        for field in allowed_fields:
-            if field in updates:
-                update_fields.append(f"{field} = ?")
-                params.append(updates[field])
-
-        if not update_fields:
-            return True  # No updates
-
-        # @@@ Mark as locally changed if content fields are modified
-        has_content_change = any(field in updates for field in content_fields)
-        if has_content_change:
-            update_fields.append("has_local_changes = 1")
-
-        update_fields.append("updated_at = CURRENT_TIMESTAMP")
-        params.append(deck_id)
-
-        db.execute(
-            f"UPDATE decks SET {', '.join(update_fields)} WHERE id = ?",
-            params
-        )
+    """
+    db = get_db()
+    try:
+        fields = tuple(field for field in _DECK_UPDATE_FIELDS if field in updates)
+        if not fields:
+            # No updates - still report whether the deck is the user's
+            return db.execute(
+                "SELECT 1 FROM decks WHERE id = ? AND owner_id = ?",
+                (deck_id, user_id)
+            ).fetchone() is not None
+
+        params = [updates[field] for field in fields]
+        params.extend((deck_id, user_id))
+
+        cursor = db.execute(_update_statement('decks', fields, _DECK_CONTENT_FIELDS), params)
         db.commit()
-        return True
+        return cursor.rowcount > 0
     finally:
         db.close()
 
@@ -568,18 +1111,12 @@ def delete_deck(user_id: int, deck_id: str) -> bool:
     """
     db = get_db()
     try:
-        # Check ownership
-        deck = db.execute(
-            "SELECT owner_id FROM decks WHERE id = ?",
-            (deck_id,)
-        ).fetchone()
-
-        if not deck or deck['owner_id'] != user_id:
-            return False
-
-        db.execute("DELETE FROM decks WHERE id = ?", (deck_id,))
+        cursor = db.execute(
+            "DELETE FROM decks WHERE id = ? AND owner_id = ?",
+            (deck_id, user_id)
+        )
         db.commit()
-        return True
+        return cursor.rowcount > 0
     finally:
         db.close()
 
@@ -588,25 +1125,40 @@ def auto_fork_system_decks(user_id: int):
     Auto-fork all system decks for a new user.
     Called on user registration/first login.
     """
-    # @@@ Get deck list then close connection BEFORE forking (avoid deadlock)
+    # @@@ One connection, one transaction, one fsync for the whole onboarding copy
     db = get_db()
     try:
+        db.execute("BEGIN IMMEDIATE")
         system_decks = db.execute(
             "SELECT id FROM decks WHERE is_system = 1 ORDER BY order_index"
         ).fetchall()
         deck_ids = [deck['id'] for deck in system_decks]
+
+        # @@@ Large copies rebuild the voice indexes once instead of per row
+        voice_total = db.execute(
+            "SELECT COUNT(*) FROM voices WHERE deck_id IN (SELECT id FROM decks WHERE is_system = 1)"
+        ).fetchone()[0]
+        rebuild_indexes = voice_total > BULK_REINDEX_THRESHOLD
+        if rebuild_indexes:
+            for name in _VOICE_INDEXES:
+                db.execute(f"DROP INDEX IF EXISTS {name}")
+
+        # @@@ Only enable introspection deck by default
+        for deck_id in deck_ids:
+            should_enable = (deck_id == 'introspection_deck')
+            fork_deck(user_id, deck_id, enabled=should_enable, db=db)
+
+        if rebuild_indexes:
+            for statement in _VOICE_INDEXES.values():
+                db.execute(statement)
+
+        db.commit()
     finally:
         db.close()
 
-    # Fork each deck (each fork opens its own connection)
-    # @@@ Only enable introspection deck by default
-    for deck_id in deck_ids:
-        should_enable = (deck_id == 'introspection_deck')
-        fork_deck(user_id, deck_id, enabled=should_enable)
-
     print(f"✅ Auto-forked {len(deck_ids)} system decks for user {user_id}")
 
-def fork_deck(user_id: int, deck_id: str, enabled: bool = True) -> str:
+def fork_deck(user_id: int, deck_id: str, enabled: bool = True, db=None) -> str:
     """
     Fork a deck to create user's own copy.
     Copies deck + all voices. Returns new deck_id.
@@ -615,66 +1167,37 @@ def fork_deck(user_id: int, deck_id: str, enabled: bool = True) -> str:
         user_id: The user who is forking the deck
         deck_id: ID of the deck to fork
         enabled: Whether the forked deck should be enabled (default: True)
+        db: Connection with an open transaction to fork inside. The caller
+            commits and closes it. When omitted, the fork runs in its own
+            transaction.
     """
-    import uuid
-
-    db = get_db()
+    owns_db = db is None
+    if owns_db:
+        db = get_db()
     try:
-        # Get source deck
-        source_deck = db.execute("SELECT * FROM decks WHERE id = ?", (deck_id,)).fetchone()
-        if not source_deck:
-            raise ValueError(f"Deck {deck_id} not found")
-
-        # Create new deck ID
-        new_deck_id = str(uuid.uuid4())
+        if owns_db:
+            db.execute("BEGIN IMMEDIATE")
 
-        # Copy deck (has_local_changes = 0 initially, synced with parent)
-        db.execute("""
-        INSERT INTO decks (id, name, name_zh, name_en, description, description_zh, description_en,
-                          icon, color, is_system, parent_id, owner_id, enabled, has_local_changes, order_index)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0, ?, ?, ?, 0, ?)
-        """, (new_deck_id,
-              source_deck['name'],
-              source_deck['name_zh'],
-              source_deck['name_en'],
-              source_deck['description'],
-              source_deck['description_zh'],
-              source_deck['description_en'],
-              source_deck['icon'],
-              source_deck['color'],
-              deck_id,  # parent_id tracks fork source
+        # Copy deck straight from the source row (has_local_changes = 0, synced with parent)
+        # @@@ RETURNING doubles as the existence check - no separate SELECT
+        copied = db.execute(_FORK_DECK_SQL, (
+              str(uuid4()),
               user_id,
               1 if enabled else 0,  # @@@ enabled parameter
-              source_deck['order_index']))
-
-        # Copy all voices
-        source_voices = db.execute(
-            "SELECT * FROM voices WHERE deck_id = ? ORDER BY order_index",
-            (deck_id,)
-        ).fetchall()
+              deck_id)).fetchall()
+        if not copied:
+            raise ValueError(f"Deck {deck_id} not found")
+        new_deck_id = copied[0]['id']
 
-        for voice in source_voices:
-            new_voice_id = str(uuid.uuid4())
-            db.execute("""
-            INSERT INTO voices (id, deck_id, name, name_zh, name_en, system_prompt,
-                              icon, color, is_system, parent_id, owner_id, enabled, has_local_changes, order_index)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0, ?, ?, 1, 0, ?)
-            """, (new_voice_id,
-                  new_deck_id,
-                  voice['name'],
-                  voice['name_zh'],
-                  voice['name_en'],
-                  voice['system_prompt'],
-                  voice['icon'],
-                  voice['color'],
-                  voice['id'],  # parent_id tracks fork source
-                  user_id,
-                  voice['order_index']))
+        # Copy all voices (parent_id tracks fork source)
+        db.execute(_COPY_DECK_VOICES_SQL, (new_deck_id, user_id, deck_id))
 
-        db.commit()
+        if owns_db:
+            db.commit()
         return new_deck_id
     finally:
-        db.close()
+        if owns_db:
+            db.close()
 
 def sync_deck_with_parent(user_id: int, deck_id: str, force: bool = False) -> dict:
     """
@@ -686,7 +1209,6 @@ def sync_deck_with_parent(user_id: int, deck_id: str, force: bool = False) -> di
     Returns: {"success": True, "synced_voices": N}
     Raises ValueError if deck not found, no parent, or parent missing
     """
-    import uuid
 
     db = get_db()
     try:
@@ -711,6 +1233,9 @@ def sync_deck_with_parent(user_id: int, deck_id: str, force: bool = False) -> di
         if not parent:
             raise ValueError("Parent deck not found")
 
+        # @@@ Metadata update, voice delete and re-insert commit together
+        db.execute("BEGIN IMMEDIATE")
+
         # @@@ Step 1: Sync deck metadata (preserve user preferences like enabled/order)
         db.execute("""
         UPDATE decks SET
@@ -728,34 +1253,11 @@ def sync_deck_with_parent(user_id: int, deck_id: str, force: bool = False) -> di
         # @@@ Step 2: Delete ALL user's voices in this deck
         db.execute("DELETE FROM voices WHERE deck_id = ?", (deck_id,))
 
-        # @@@ Step 3: Re-create all voices from parent (fresh copy)
-        parent_voices = db.execute(
-            "SELECT * FROM voices WHERE deck_id = ? ORDER BY order_index",
-            (deck['parent_id'],)
-        ).fetchall()
-
-        synced_count = 0
-        for parent_voice in parent_voices:
-            new_voice_id = str(uuid.uuid4())
-            db.execute("""
-            INSERT INTO voices (id, deck_id, name, name_zh, name_en, system_prompt,
-                              icon, color, is_system, parent_id, owner_id, enabled, has_local_changes, order_index)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0, ?, ?, 1, 0, ?)
-            """, (new_voice_id,
-                  deck_id,  # User's deck
-                  parent_voice['name'],
-                  parent_voice['name_zh'],
-                  parent_voice['name_en'],
-                  parent_voice['system_prompt'],
-                  parent_voice['icon'],
-                  parent_voice['color'],
-                  parent_voice['id'],  # parent_id tracks original
-                  user_id,
-                  parent_voice['order_index']))
-            synced_count += 1
+        # @@@ Step 3: Re-create all voices from parent (fresh copy, parent_id tracks original)
+        synced = db.execute(_COPY_DECK_VOICES_SQL, (deck_id, user_id, deck['parent_id'])).rowcount
 
         db.commit()
-        return {"success": True, "synced_voices": synced_count}
+        return {"success": True, "synced_voices": synced}
     finally:
         db.close()
 
@@ -768,27 +1270,15 @@ def load_voices_from_user_decks(user_id: int) -> dict:
     """
     db = get_db()
     try:
-        # Get all user's enabled decks
-        enabled_decks = db.execute("""
-        SELECT id FROM decks
-        WHERE owner_id = ? AND enabled = 1
-        ORDER BY order_index, created_at
+        # @@@ One static statement: enabled voices of the user's enabled decks
+        voices = db.execute("""
+        SELECT v.id, v.name, v.system_prompt, v.icon, v.color
+        FROM decks d
+        JOIN voices v ON v.deck_id = d.id
+        WHERE d.owner_id = ? AND d.enabled = 1 AND v.enabled = 1
+        ORDER BY v.order_index, v.created_at
         """, (user_id,)).fetchall()
 
-        if not enabled_decks:
-            return {}
-
-        deck_ids = [deck['id'] for deck in enabled_decks]
-
-        # Get all enabled voices from these decks
-        placeholders = ','.join('?' * len(deck_ids))
-        voices = db.execute(f"""
-        SELECT id, name, system_prompt, icon, color
-        FROM voices
-        WHERE deck_id IN ({placeholders}) AND enabled = 1
-        ORDER BY order_index, created_at
-        """, deck_ids).fetchall()
-
         # Convert to expected format
         voice_dict = {}
         for voice in voices:
@@ -813,38 +1303,24 @@ def create_voice(user_id: int, deck_id: str, name: str, system_prompt: str,
     Create a new voice in a user's deck.
     Returns voice_id.
     """
-    import uuid
-
     db = get_db()
     try:
-        # Check deck ownership
-        deck = db.execute(
-            "SELECT owner_id FROM decks WHERE id = ?",
-            (deck_id,)
-        ).fetchone()
-
-        if not deck or deck['owner_id'] != user_id:
-            raise ValueError("Deck not found or permission denied")
-
-        voice_id = str(uuid.uuid4())
-
-        # Get max order_index if not provided
-        if order_index is None:
-            max_order = db.execute(
-                "SELECT MAX(order_index) as max_order FROM voices WHERE deck_id = ?",
-                (deck_id,)
-            ).fetchone()['max_order']
-            order_index = (max_order or 0) + 1
-
-        db.execute("""
+        # @@@ One statement: ownership check + default order_index (append) + insert
+        rows = db.execute("""
         INSERT INTO voices (id, deck_id, name, name_zh, name_en, system_prompt,
                            icon, color, is_system, owner_id, enabled, has_local_changes, order_index)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0, ?, 1, 0, ?)
-        """, (voice_id, deck_id, name, name_zh, name_en, system_prompt,
-              icon, color, user_id, order_index))
+        SELECT ?, ?, ?, ?, ?, ?, ?, ?, 0, ?, 1, 0,
+               COALESCE(?, (SELECT COALESCE(MAX(order_index), 0) + 1 FROM voices WHERE deck_id = ?))
+        WHERE EXISTS (SELECT 1 FROM decks WHERE id = ? AND owner_id = ?)
+        RETURNING id
+        """, (str(uuid4()), deck_id, name, name_zh, name_en, system_prompt,
+              icon, color, user_id, order_index, deck_id, deck_id, user_id)).fetchall()
+
+        if not rows:
+            raise ValueError("Deck not found or permission denied")
 
         db.commit()
-        return voice_id
+        return rows[0]['id']
     finally:
         db.close()
 
@@ -861,45 +1337,20 @@ def update_voice(user_id: int, voice_id: str, updates: dict) -> bool:
     """
     db = get_db()
     try:
-        # Check ownership
-        voice = db.execute(
-            "SELECT owner_id FROM voices WHERE id = ?",
-            (voice_id,)
-        ).fetchone()
-
-        if not voice or voice['owner_id'] != user_id:
-            return False
-
-        # Build update query
-        allowed_fields = ['name', 'name_zh', 'name_en', 'system_prompt',
-                         'icon', 'color', 'enabled', 'order_index']
-        content_fields = ['name', 'name_zh', 'name_en', 'system_prompt',
-                         'icon', 'color']
-
-        update_fields = []
-        params = []
-        for field in allowed_fields:
-            if field in updates:
-                update_fields.append(f"{field} = ?")
-                params.append(updates[field])
-
-        if not update_fields:
-            return True  # No updates
-
-        # @@@ Mark as locally changed if content fields are modified
-        has_content_change = any(field in updates for field in content_fields)
-        if has_content_change:
-            update_fields.append("has_local_changes = 1")
-
-        update_fields.append("updated_at = CURRENT_TIMESTAMP")
-        params.append(voice_id)
-
-        db.execute(
-            f"UPDATE voices SET {', '.join(update_fields)} WHERE id = ?",
-            params
-        )
+        fields = tuple(field for field in _VOICE_UPDATE_FIELDS if field in updates)
+        if not fields:
+            # No updates - still report whether the voice is the user's
+            return db.execute(
+                "SELECT 1 FROM voices WHERE id = ? AND owner_id = ?",
+                (voice_id, user_id)
+            ).fetchone() is not None
+
+        params = [updates[field] for field in fields]
+        params.extend((voice_id, user_id))
+
+        cursor = db.execute(_update_statement('voices', fields, _VOICE_CONTENT_FIELDS), params)
         db.commit()
-        return True
+        return cursor.rowcount > 0
     finally:
         db.close()
 
@@ -910,18 +1361,12 @@ def delete_voice(user_id: int, voice_id: str) -> bool:
     """
     db = get_db()
     try:
-        # Check ownership
-        voice = db.execute(
-            "SELECT owner_id FROM voices WHERE id = ?",
-            (voice_id,)
-        ).fetchone()
-
-        if not voice or voice['owner_id'] != user_id:
-            return False
-
-        db.execute("DELETE FROM voices WHERE id = ?", (voice_id,))
+        cursor = db.execute(
+            "DELETE FROM voices WHERE id = ? AND owner_id = ?",
+            (voice_id, user_id)
+        )
         db.commit()
-        return True
+        return cursor.rowcount > 0
     finally:
         db.close()
 
@@ -930,50 +1375,24 @@ def fork_voice(user_id: int, voice_id: str, target_deck_id: str) -> str:
     Fork a voice to a user's deck.
     Returns new voice_id.
     """
-    import uuid
-
     db = get_db()
     try:
-        # Check target deck ownership
-        deck = db.execute(
-            "SELECT owner_id FROM decks WHERE id = ?",
-            (target_deck_id,)
-        ).fetchone()
-
-        if not deck or deck['owner_id'] != user_id:
-            raise ValueError("Target deck not found or permission denied")
-
-        # Get source voice
-        source_voice = db.execute("SELECT * FROM voices WHERE id = ?", (voice_id,)).fetchone()
-        if not source_voice:
+        new_voice_id = str(uuid4())
+        # Ownership check, source fetch, next order_index and insert in one statement
+        cursor = db.execute(_FORK_VOICE_SQL, (
+            new_voice_id, target_deck_id, user_id, target_deck_id,
+            voice_id, target_deck_id, user_id))
+
+        if cursor.rowcount == 0:
+            # Failure path only: work out which precondition failed
+            owned = db.execute(
+                "SELECT 1 FROM decks WHERE id = ? AND owner_id = ?",
+                (target_deck_id, user_id)
+            ).fetchone()
+            if not owned:
+                raise ValueError("Target deck not found or permission denied")
             raise ValueError(f"Voice {voice_id} not found")
 
-        # Create new voice
-        new_voice_id = str(uuid.uuid4())
-
-        # Get max order_index in target deck
-        max_order = db.execute(
-            "SELECT MAX(order_index) as max_order FROM voices WHERE deck_id = ?",
-            (target_deck_id,)
-        ).fetchone()['max_order']
-        order_index = (max_order or 0) + 1
-
-        db.execute("""
-        INSERT INTO voices (id, deck_id, name, name_zh, name_en, system_prompt,
-                           icon, color, is_system, parent_id, owner_id, enabled, order_index)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0, ?, ?, 1, ?)
-        """, (new_voice_id,
-              target_deck_id,
-              source_voice['name'],
-              source_voice['name_zh'],
-              source_voice['name_en'],
-              source_voice['system_prompt'],
-              source_voice['icon'],
-              source_voice['color'],
-              voice_id,  # parent_id tracks fork source
-              user_id,
-              order_index))
-
         db.commit()
         return new_voice_id
     finally:
@@ -1009,6 +1428,18 @@ def get_user_by_email(email: str):
     finally:
         db.close()
 
+def update_user_password_hash(user_id: int, password_hash: str):
+    """Replace a user's password hash (e.g. after a bcrypt cost upgrade)."""
+    import auth
+    db = get_db()
+    try:
+        db.execute("UPDATE users SET password_hash = ? WHERE id = ?", (password_hash, user_id))
+        db.commit()
+    finally:
+        db.close()
+    # Cached verifications were made against the old hash
+    auth.clear_verify_cache()
+
 def get_user_by_id(user_id: int):
     """Get user by ID. Returns dict or None."""
     db = get_db()
@@ -1031,21 +1462,77 @@ def _normalize_created_at(created_at: Optional[Union[str, datetime]]) -> Optiona
     return str(created_at)
 
 
+def _has_text_content(editor_state) -> bool:
+    """True if any text cell has non-whitespace content."""
+    cells = editor_state.get('cells') if isinstance(editor_state, dict) else None
+    return any(
+        isinstance(cell, dict) and cell.get('type') == 'text'
+        and isinstance(cell.get('content'), str) and cell['content'].strip()
+        for cell in cells or []
+    )
+
+def _may_have_text(raw: Union[bytes, str]) -> bool:
+    """
+    Byte-scan prefilter for _has_text_content on serialized state.
+
+    @@@ Necessary, not sufficient: a text cell always serializes the literal
+    "text" and "content" keys (json/orjson never escape ASCII letters), so a
+    miss means no parse is needed. A hit still gets the full check.
+    """
+    if isinstance(raw, str):
+        raw = raw.encode('utf-8')
+    return b'"text"' in raw and b'"content"' in raw
+
+def _content_hash(payload: bytes) -> bytes:
+    """128-bit digest of a serialized editor state (change detection only)."""
+    return hashlib.blake2b(payload, digest_size=16).digest()
+
 def save_session(user_id: int, session_id: str, editor_state: dict, name: str = None,
                  created_at: Optional[Union[str, datetime]] = None):
-    """Save or update a user session."""
+    """
+    Save or update a user session.
+
+    @@@ Autosave often posts the state it saved last time. When the digest
+    matches the stored one, only name/updated_at are written - the state
+    BLOB (and its overflow pages) stays untouched.
+    """
+    payload = _json_dumpb(editor_state)
+    content_hash = _content_hash(payload)
+
     db = get_db()
     try:
         created_at_value = _normalize_created_at(created_at)
-        db.execute("""
-        INSERT INTO user_sessions (id, user_id, name, editor_state_json, created_at, updated_at)
-        VALUES (?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP), CURRENT_TIMESTAMP)
-        ON CONFLICT(id) DO UPDATE SET
-          editor_state_json = excluded.editor_state_json,
-          name = COALESCE(excluded.name, user_sessions.name),
-          updated_at = CURRENT_TIMESTAMP
-        """, (session_id, user_id, name, json.dumps(editor_state), created_at_value))
+        # Read + write in one transaction so a concurrent save can't slip in between
+        db.execute("BEGIN IMMEDIATE")
+        row = db.execute(
+            "SELECT content_hash FROM user_sessions WHERE id = ? AND user_id = ?",
+            (session_id, user_id)
+        ).fetchone()
+        if row is not None and row[0] == content_hash:
+            db.execute("""
+            UPDATE user_sessions
+            SET name = COALESCE(?, name), updated_at = CURRENT_TIMESTAMP
+            WHERE id = ?
+            """, (name, session_id))
+        else:
+            db.execute("""
+            INSERT INTO user_sessions (id, user_id, name, editor_state_json, has_text_content, content_hash,
+                                       created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP), CURRENT_TIMESTAMP)
+            ON CONFLICT(id) DO UPDATE SET
+              editor_state_json = excluded.editor_state_json,
+              has_text_content = excluded.has_text_content,
+              content_hash = excluded.content_hash,
+              name = COALESCE(excluded.name, user_sessions.name),
+              updated_at = CURRENT_TIMESTAMP
+            """, (session_id, user_id, name, payload,
+                  int(_has_text_content(editor_state)), content_hash, created_at_value))
+        # updated_at moved either way, so the session may have changed day
+        _invalidate_daily_notes(db, user_id)
         db.commit()
+    except Exception:
+        db.rollback()
+        raise
     finally:
         db.close()
 
@@ -1061,13 +1548,24 @@ def get_session(user_id: int, session_id: str):
 
         if row:
             result = dict(row)
-            result['editor_state'] = json.loads(result['editor_state_json'])
+            result['editor_state'] = _json_loads(result['editor_state_json'])
             del result['editor_state_json']
             return result
         return None
     finally:
         db.close()
 
+# @@@ Ids arrive as one JSON array parameter, so the SQL text is the same for
+# every batch size and stays a single entry in the statement cache (an
+# IN (?,?,...) list compiles a new statement per length and evicts hot ones).
+# CROSS JOIN pins the order: one primary-key probe per requested id.
+_SESSIONS_BATCH_SQL = """
+SELECT s.id, s.name, s.editor_state_json, s.created_at, s.updated_at
+FROM json_each(?) j
+CROSS JOIN user_sessions s ON s.id = j.value
+WHERE s.user_id = ?
+"""
+
 def get_sessions_batch(user_id: int, session_ids: list[str]) -> list[dict]:
     """Fetch multiple sessions in a single query (includes full editor_state)."""
     if not session_ids:
@@ -1075,17 +1573,11 @@ def get_sessions_batch(user_id: int, session_ids: list[str]) -> list[dict]:
 
     db = get_db()
     try:
-        placeholders = ",".join("?" for _ in session_ids)
-        query = f"""
-        SELECT id, name, editor_state_json, created_at, updated_at
-        FROM user_sessions
-        WHERE user_id = ? AND id IN ({placeholders})
-        """
-        rows = db.execute(query, (user_id, *session_ids)).fetchall()
+        rows = db.execute(_SESSIONS_BATCH_SQL, (_json_dumps(list(dict.fromkeys(session_ids))), user_id)).fetchall()
         sessions = []
         for row in rows:
             try:
-                state = json.loads(row["editor_state_json"])
+                state = _json_loads(row["editor_state_json"])
             except Exception:
                 state = {}
             sessions.append(
@@ -1101,41 +1593,50 @@ def get_sessions_batch(user_id: int, session_ids: list[str]) -> list[dict]:
     finally:
         db.close()
 
+# @@@ First non-empty text cell, extracted by JSON1 inside SQLite so listings
+# never ship or parse whole editor states. CASE guards keep malformed rows
+# (invalid JSON, non-array cells, non-object cells) at NULL instead of erroring.
+# States are stored as BLOBs, which JSON1 rejects - CAST them back to TEXT.
+_FIRST_TEXT_SQL = """
+CASE WHEN json_valid(CAST(s.editor_state_json AS TEXT))
+          AND json_type(CAST(s.editor_state_json AS TEXT), '$.cells') = 'array' THEN (
+  SELECT json_extract(c.value, '$.content')
+  FROM json_each(CAST(s.editor_state_json AS TEXT), '$.cells') c
+  WHERE CASE WHEN c.type = 'object'
+             THEN json_extract(c.value, '$.type') = 'text'
+                  AND COALESCE(json_extract(c.value, '$.content'), '') != ''
+        END
+  ORDER BY c.key
+  LIMIT 1
+) END"""
+
+def _first_line(first_text) -> str:
+    """Session preview: first line of the first text cell, max 30 chars."""
+    if not isinstance(first_text, str):
+        return ""
+    return first_text.strip().split("\n")[0][:30]
+
 def list_sessions(user_id: int):
     """List all sessions for a user with a lightweight preview."""
     db = get_db()
     try:
-        rows = db.execute("""
-        SELECT id, name, editor_state_json, created_at, updated_at
-        FROM user_sessions
+        rows = _fetch_tuples(db, f"""
+        SELECT id, name, {_FIRST_TEXT_SQL} AS first_text, created_at, updated_at
+        FROM user_sessions s
         WHERE user_id = ?
         ORDER BY updated_at DESC
-        """, (user_id,)).fetchall()
-
-        results = []
-        for row in rows:
-            first_line = ""
-            try:
-                state = json.loads(row["editor_state_json"])
-                first_text = next(
-                    (c.get("content", "").strip() for c in state.get("cells", []) if c.get("type") == "text" and c.get("content")),
-                    ""
-                )
-                if first_text:
-                    first_line = first_text.split("\n")[0][:30]
-            except Exception:
-                first_line = ""
-
-            results.append(
-                {
-                    "id": row["id"],
-                    "name": row["name"],
-                    "created_at": row["created_at"],
-                    "updated_at": row["updated_at"],
-                    "first_line": first_line,
-                }
-            )
-        return results
+        """, (user_id,))
+
+        return [
+            {
+                "id": session_id,
+                "name": name,
+                "created_at": created_at,
+                "updated_at": updated_at,
+                "first_line": _first_line(first_text),
+            }
+            for session_id, name, first_text, created_at, updated_at in rows
+        ]
     finally:
         db.close()
 
@@ -1146,39 +1647,25 @@ def list_sessions_in_range(user_id: int, start_date: Optional[str], end_date: Op
     """
     db = get_db()
     try:
-        rows = db.execute(f"""
-        SELECT id, name, editor_state_json, created_at, updated_at
-        FROM user_sessions
+        rows = _fetch_tuples(db, f"""
+        SELECT id, name, {_FIRST_TEXT_SQL} AS first_text, created_at, updated_at
+        FROM user_sessions s
         WHERE user_id = ?
           AND (? IS NULL OR date(COALESCE(created_at, updated_at)) >= ?)
           AND (? IS NULL OR date(COALESCE(created_at, updated_at)) <= ?)
         ORDER BY updated_at DESC
-        """, (user_id, start_date, start_date, end_date, end_date)).fetchall()
-
-        results = []
-        for row in rows:
-            first_line = ""
-            try:
-                state = json.loads(row["editor_state_json"])
-                first_text = next(
-                    (c.get("content", "").strip() for c in state.get("cells", []) if c.get("type") == "text" and c.get("content")),
-                    ""
-                )
-                if first_text:
-                    first_line = first_text.split("\n")[0][:30]
-            except Exception:
-                first_line = ""
-
-            results.append(
-                {
-                    "id": row["id"],
-                    "name": row["name"],
-                    "created_at": row["created_at"],
-                    "updated_at": row["updated_at"],
-                    "first_line": first_line,
-                }
-            )
-        return results
+        """, (user_id, start_date, start_date, end_date, end_date))
+
+        return [
+            {
+                "id": session_id,
+                "name": name,
+                "created_at": created_at,
+                "updated_at": updated_at,
+                "first_line": _first_line(first_text),
+            }
+            for session_id, name, first_text, created_at, updated_at in rows
+        ]
     finally:
         db.close()
 
@@ -1189,8 +1676,10 @@ def get_all_sessions_with_text(user_id: int) -> list[dict]:
     """
     db = get_db()
     try:
+        # Flagged-empty sessions skip the state column entirely
         rows = db.execute("""
-        SELECT id, name, editor_state_json, created_at, updated_at
+        SELECT id, name, created_at, updated_at,
+               CASE WHEN has_text_content = 1 THEN editor_state_json END AS editor_state_json
         FROM user_sessions
         WHERE user_id = ?
         ORDER BY updated_at DESC
@@ -1198,15 +1687,18 @@ def get_all_sessions_with_text(user_id: int) -> list[dict]:
 
         sessions = []
         for row in rows:
-            try:
-                state = json.loads(row['editor_state_json'])
-                text = '\n\n'.join(
-                    cell.get('content', '')
-                    for cell in state.get('cells', [])
-                    if cell.get('type') == 'text' and cell.get('content', '').strip()
-                ).strip()
-            except Exception:
+            if row['editor_state_json'] is None:
                 text = ''
+            else:
+                try:
+                    state = _json_loads(row['editor_state_json'])
+                    text = '\n\n'.join(
+                        cell.get('content', '')
+                        for cell in state.get('cells', [])
+                        if cell.get('type') == 'text' and cell.get('content', '').strip()
+                    ).strip()
+                except Exception:
+                    text = ''
 
             item = {
                 'id': row['id'],
@@ -1225,12 +1717,27 @@ def delete_session(user_id: int, session_id: str):
     db = get_db()
     try:
         db.execute("DELETE FROM user_sessions WHERE user_id = ? AND id = ?", (user_id, session_id))
+        _invalidate_daily_notes(db, user_id)
         db.commit()
     finally:
         db.close()
 
 # ========== Timeline Auto-Generation Helpers ==========
 
+@lru_cache(maxsize=1024)
+def _utc_day_window(target_date: str, timezone: str) -> tuple[str, str]:
+    """
+    UTC bounds (inclusive) of a local calendar day, formatted like the stored timestamps.
+
+    @@@ CURRENT_TIMESTAMP text is 'YYYY-MM-DD HH:MM:SS'; comparing it against
+    isoformat() ('T' separator) misorders rows on the boundary UTC days
+    Example: 2025-01-17 in Beijing = 2025-01-16 16:00:00 to 2025-01-17 15:59:59 UTC
+    """
+    local_date = datetime.strptime(target_date, '%Y-%m-%d').replace(tzinfo=ZoneInfo(timezone))
+    start_utc = local_date.astimezone(ZoneInfo('UTC'))
+    end_utc = (local_date + timedelta(days=1)).astimezone(ZoneInfo('UTC')) - timedelta(seconds=1)
+    return start_utc.strftime('%Y-%m-%d %H:%M:%S'), end_utc.strftime('%Y-%m-%d %H:%M:%S')
+
 def get_users_with_activity_on_date(target_date: str, timezone: str = 'Asia/Shanghai') -> list[int]:
     """
     Get user IDs who updated sessions on target_date (local timezone).
@@ -1244,49 +1751,74 @@ def get_users_with_activity_on_date(target_date: str, timezone: str = 'Asia/Shan
 
     @@@ Timezone handling - SQLite stores UTC, we convert to local timezone for date matching
     """
-    from datetime import datetime
-    from zoneinfo import ZoneInfo
+    start_utc, end_utc = _utc_day_window(target_date, timezone)
 
     db = get_db()
     try:
-        # @@@ Convert target_date (local) to UTC range for database query
-        # Example: 2025-01-17 in Beijing = 2025-01-16 16:00 UTC to 2025-01-17 16:00 UTC
-        tz = ZoneInfo(timezone)
-        local_date = datetime.strptime(target_date, '%Y-%m-%d').replace(tzinfo=tz)
-
-        # Get start and end of day in UTC
-        start_of_day_local = local_date.replace(hour=0, minute=0, second=0, microsecond=0)
-        end_of_day_local = local_date.replace(hour=23, minute=59, second=59, microsecond=999999)
-
-        start_utc = start_of_day_local.astimezone(ZoneInfo('UTC'))
-        end_utc = end_of_day_local.astimezone(ZoneInfo('UTC'))
-
-        # Query sessions updated in this UTC range
+        # Users with a non-empty session updated in this UTC range (flag set by save_session)
         rows = db.execute("""
-            SELECT DISTINCT user_id, editor_state_json
+            SELECT DISTINCT user_id
             FROM user_sessions
             WHERE updated_at >= ? AND updated_at <= ?
-        """, (start_utc.isoformat(), end_utc.isoformat())).fetchall()
+              AND has_text_content = 1
+        """, (start_utc, end_utc)).fetchall()
 
-        # Filter users with non-empty content
-        user_ids = []
-        for row in rows:
-            try:
-                state = json.loads(row['editor_state_json'])
-                # Check if has any text cells with content
-                has_content = any(
-                    cell.get('type') == 'text' and cell.get('content', '').strip()
-                    for cell in state.get('cells', [])
-                )
-                if has_content and row['user_id'] not in user_ids:
-                    user_ids.append(row['user_id'])
-            except (json.JSONDecodeError, KeyError):
-                continue
-
-        return user_ids
+        return [row['user_id'] for row in rows]
+    finally:
+        db.close()
+
+# @@@ Same logic as frontend's getAllNotesFromSessions(), run by JSON1 inside SQLite:
+# text cells with non-blank string content, in cell order. Malformed states yield
+# no rows; s.id keeps cells of sessions sharing an updated_at from interleaving.
+def _day_text_cells_sql(one_user: bool) -> str:
+    """Params: [user_id,] start_utc, end_utc. Rows: (user_id, content)."""
+    return f"""
+    SELECT s.user_id, json_extract(c.value, '$.content') AS content
+    FROM user_sessions s,
+         json_each(CASE WHEN json_valid(CAST(s.editor_state_json AS TEXT))
+                        THEN CAST(s.editor_state_json AS TEXT) ELSE '{{}}' END, '$.cells') c
+    WHERE {"s.user_id = ? AND" if one_user else ""}
+          s.updated_at >= ?
+      AND s.updated_at <= ?
+      AND s.has_text_content = 1
+      AND c.type = 'object'
+      AND json_extract(c.value, '$.type') = 'text'
+      AND json_type(c.value, '$.content') = 'text'
+      AND trim(json_extract(c.value, '$.content'), ' ' || char(9, 10, 11, 12, 13)) != ''
+    ORDER BY {"" if one_user else "s.user_id, "}s.updated_at DESC, s.id, c.key
+    """
+
+_DAY_TEXT_CELLS_SQL = _day_text_cells_sql(one_user=True)
+_ALL_USERS_DAY_TEXT_CELLS_SQL = _day_text_cells_sql(one_user=False)
+
+def get_users_text_on_date(target_date: str, timezone: str = 'Asia/Shanghai') -> list[tuple[int, str]]:
+    """
+    Every active user's text for target_date (local timezone) in one query.
+
+    Returns:
+        [(user_id, text)] for users with non-empty text, same text as
+        extract_text_from_sessions_on_date gives per user
+
+    @@@ Replaces get_users_with_activity_on_date + one extract per user
+    """
+    start_utc, end_utc = _utc_day_window(target_date, timezone)
+
+    db = get_db()
+    try:
+        rows = _fetch_tuples(db, _ALL_USERS_DAY_TEXT_CELLS_SQL, (start_utc, end_utc))
+        return [
+            (user_id, '\n\n'.join(content for _, content in cells))
+            for user_id, cells in groupby(rows, key=itemgetter(0))
+        ]
     finally:
         db.close()
 
+def _invalidate_daily_notes(db, user_id: int):
+    """Drop cached day texts for a user (caller commits)."""
+    # @@@ Whole user, not one day: a save moves updated_at, so the session leaves an
+    # older day's text as well as joining today's, in whatever timezone was cached
+    db.execute("DELETE FROM daily_notes_cache WHERE user_id = ?", (user_id,))
+
 def extract_text_from_sessions_on_date(user_id: int, target_date: str, timezone: str = 'Asia/Shanghai') -> str:
     """
     Extract all text from user's sessions updated on target_date (local timezone).
@@ -1301,70 +1833,162 @@ def extract_text_from_sessions_on_date(user_id: int, target_date: str, timezone:
 
     @@@ Replicates frontend's getAllNotesFromSessions() logic but date-filtered
     @@@ Timezone handling - SQLite stores UTC, we convert to local timezone for date matching
+    @@@ Cached in daily_notes_cache until the user's sessions next change
     """
-    from datetime import datetime
-    from zoneinfo import ZoneInfo
+    start_utc, end_utc = _utc_day_window(target_date, timezone)
 
     db = get_db()
     try:
-        # @@@ Convert target_date (local) to UTC range for database query
-        tz = ZoneInfo(timezone)
-        local_date = datetime.strptime(target_date, '%Y-%m-%d').replace(tzinfo=tz)
-
-        start_of_day_local = local_date.replace(hour=0, minute=0, second=0, microsecond=0)
-        end_of_day_local = local_date.replace(hour=23, minute=59, second=59, microsecond=999999)
+        cached = db.execute("""
+            SELECT text FROM daily_notes_cache
+            WHERE user_id = ? AND local_date = ? AND tz = ?
+        """, (user_id, target_date, timezone)).fetchone()
+        if cached:
+            return cached['text']
+
+        # Non-empty text cells of sessions updated in this UTC range, newest session first
+        # (write txn so a concurrent save can't invalidate between the read and the store)
+        db.execute("BEGIN IMMEDIATE")
+        rows = db.execute(_DAY_TEXT_CELLS_SQL,
+                          (user_id, start_utc, end_utc)).fetchall()
+        text = '\n\n'.join(row['content'] for row in rows)
 
-        start_utc = start_of_day_local.astimezone(ZoneInfo('UTC'))
-        end_utc = end_of_day_local.astimezone(ZoneInfo('UTC'))
-
-        # Get sessions updated in this UTC range
-        rows = db.execute("""
-            SELECT editor_state_json
-            FROM user_sessions
-            WHERE user_id = ?
-              AND updated_at >= ?
-              AND updated_at <= ?
-            ORDER BY updated_at DESC
-        """, (user_id, start_utc.isoformat(), end_utc.isoformat())).fetchall()
-
-        # Extract text from each session
-        all_text = []
-        for row in rows:
-            try:
-                state = json.loads(row['editor_state_json'])
-                # @@@ Same logic as frontend: filter text cells, extract content
-                text = '\n\n'.join(
-                    cell['content']
-                    for cell in state.get('cells', [])
-                    if cell.get('type') == 'text' and cell.get('content', '').strip()
-                )
-                if text.strip():
-                    all_text.append(text)
-            except (json.JSONDecodeError, KeyError):
-                continue
-
-        return '\n\n'.join(all_text)
+        db.execute("""
+            INSERT OR REPLACE INTO daily_notes_cache (user_id, local_date, tz, text)
+            VALUES (?, ?, ?, ?)
+        """, (user_id, target_date, timezone, text))
+        db.commit()
+        return text
     finally:
         db.close()
 
 # ========== Daily Pictures ==========
 
-def save_daily_picture(user_id: int, date: str, image_base64: str, prompt: str = None, thumbnail_base64: str = None):
-    """Save daily picture (replaces any existing picture for this user+date)."""
+def _decode_picture(image_base64: Union[str, bytes], strict: bool = True) -> bytes:
+    """Base64 (optionally a data: URL) → raw image bytes. Bytes pass through."""
+    if isinstance(image_base64, bytes):
+        return image_base64
+    if image_base64.startswith("data:"):
+        image_base64 = image_base64.partition(",")[2]
+    try:
+        return _b64decode(image_base64, validate=strict)
+    except binascii.Error as e:
+        raise ValueError(f"Invalid base64 image: {e}") from e
+
+def _decode_thumbnail(thumbnail: Union[str, bytes, None], strict: bool = True) -> Optional[bytes]:
+    """Thumbnail payload → raw bytes; missing (or, non-strict, undecodable) → None."""
+    if not thumbnail:
+        return None
+    try:
+        return _decode_picture(thumbnail, strict=strict) or None
+    except ValueError:
+        if strict:
+            raise
+        return None  # Preview falls back to the full image
+
+# Timeline thumbnails: same width as the generator's, WebP (~30% under JPEG at equal quality)
+THUMBNAIL_WIDTH = 400
+THUMBNAIL_WEBP_QUALITY = 70
+
+def _is_webp(image: bytes) -> bool:
+    return image[:4] == b"RIFF" and image[8:12] == b"WEBP"
+
+def make_thumbnail(image) -> Optional[bytes]:
+    """
+    Downscale (never upscale) to THUMBNAIL_WIDTH and encode as WebP.
+
+    Args:
+        image: Encoded image bytes, or an already decoded PIL image (left untouched)
+
+    Returns:
+        WebP bytes, or None if the image can't be decoded/encoded - the
+        preview then falls back to the full image.
+    """
+    from io import BytesIO
+    from PIL import Image
+
+    try:
+        if isinstance(image, (bytes, bytearray, memoryview)):
+            # thumbnail() on a lazily opened JPEG lets the decoder downscale (draft mode)
+            with Image.open(BytesIO(image)) as img:
+                img.thumbnail((THUMBNAIL_WIDTH, THUMBNAIL_WIDTH * 4), Image.Resampling.LANCZOS)
+                return _encode_webp(img)
+        img = image.copy()
+        img.thumbnail((THUMBNAIL_WIDTH, THUMBNAIL_WIDTH * 4), Image.Resampling.LANCZOS)
+        return _encode_webp(img)
+    except Exception as e:
+        print(f"⚠️ Thumbnail encoding failed: {e}")
+        return None
+
+def _encode_webp(img) -> bytes:
+    from io import BytesIO
+
+    if img.mode not in ("RGB", "RGBA"):
+        img = img.convert("RGBA" if "A" in img.getbands() or "transparency" in img.info else "RGB")
+    output = BytesIO()
+    img.save(output, format="WEBP", quality=THUMBNAIL_WEBP_QUALITY, method=4)
+    return output.getvalue()
+
+def _store_picture_blob(db, image_base64: str, strict: bool = True) -> str:
+    """Store the image bytes once (content-addressed). Returns the hash."""
+    image = _decode_picture(image_base64, strict=strict)
+    image_hash = hashlib.sha256(image).hexdigest()
+    db.execute(
+        "INSERT OR IGNORE INTO daily_picture_blobs (hash, image) VALUES (?, ?)",
+        (image_hash, image)
+    )
+    return image_hash
+
+def _picture_base64(value) -> Optional[str]:
+    """Thumbnail TEXT passes through; blob bytes get base64-encoded for the API."""
+    if isinstance(value, bytes):
+        return _b64encode(value)
+    return value
+
+# @@@ Thumbnail, falling back to the full image only when no thumbnail exists.
+# COALESCE is lazy, so the blob subquery runs just for thumbnail-less rows.
+_PICTURE_PREVIEW_SQL = """COALESCE(p.thumbnail,
+         (SELECT b.image FROM daily_picture_blobs b WHERE b.hash = p.image_hash))"""
+
+def save_daily_picture(user_id: int, date: str, image_base64: Union[str, bytes], prompt: str = None,
+                       thumbnail_base64: Union[str, bytes, None] = None):
+    """
+    Save daily picture (replaces any existing picture for this user+date).
+
+    Image and thumbnail may be base64 text (optionally a data: URL) or raw
+    bytes; both are stored as bytes and base64-encoded again only on read.
+
+    @@@ Thumbnails are stored as WebP: generated from the image when missing
+    (or just a copy of it), transcoded when given in another format.
+    """
+    # Decode, hash and encode before the write transaction starts (and before anything is deleted)
+    image = _decode_picture(image_base64)
+    image_hash = hashlib.sha256(image).hexdigest()
+    thumbnail = _decode_thumbnail(thumbnail_base64)
+    if thumbnail is None or thumbnail == image:
+        thumbnail = make_thumbnail(image)
+    elif not _is_webp(thumbnail):
+        thumbnail = make_thumbnail(thumbnail) or thumbnail
+
     db = get_db()
     try:
         # @@@ Delete old pictures for this user+date combination first
         # This ensures only ONE picture per day while avoiding UNIQUE constraint timezone issues
+        # (DELETE + INSERTs share one implicit transaction, committed once below)
         db.execute("""
         DELETE FROM daily_pictures
         WHERE user_id = ? AND date = ?
         """, (user_id, date))
 
         # Insert the new picture
+        db.execute(
+            "INSERT OR IGNORE INTO daily_picture_blobs (hash, image) VALUES (?, ?)",
+            (image_hash, image)
+        )
         db.execute("""
-        INSERT INTO daily_pictures (user_id, date, image_base64, thumbnail_base64, prompt)
+        INSERT INTO daily_pictures (user_id, date, image_hash, thumbnail, prompt)
         VALUES (?, ?, ?, ?, ?)
-        """, (user_id, date, image_base64, thumbnail_base64, prompt))
+        """, (user_id, date, image_hash, thumbnail, prompt))
 
         db.commit()
     finally:
@@ -1376,37 +2000,51 @@ def get_daily_pictures(user_id: int, limit: int = 30):
     try:
         # @@@ Use COALESCE to return thumbnail, fallback to full image only if needed
         # This prevents loading full images when thumbnails exist
-        rows = db.execute("""
-        SELECT date, COALESCE(thumbnail_base64, image_base64) as base64, prompt, created_at
-        FROM daily_pictures
+        rows = _fetch_tuples(db, f"""
+        SELECT date, {_PICTURE_PREVIEW_SQL} as base64, prompt, created_at
+        FROM daily_pictures p
         WHERE user_id = ?
         ORDER BY date DESC
         LIMIT ?
-        """, (user_id, limit)).fetchall()
+        """, (user_id, limit))
         return [{
-            'date': row['date'],
-            'base64': row['base64'],
-            'prompt': row['prompt'] or '',
-            'created_at': row['created_at']
-        } for row in rows]
+            'date': date,
+            'base64': _picture_base64(preview),
+            'prompt': prompt or '',
+            'created_at': created_at
+        } for date, preview, prompt, created_at in rows]
     finally:
         db.close()
 
+def picture_media_type(image: bytes) -> str:
+    """MIME type of stored image bytes (JPEG from the generator, PNG/WebP from imports)."""
+    if image[:3] == b"\xff\xd8\xff":
+        return "image/jpeg"
+    if image[:8] == b"\x89PNG\r\n\x1a\n":
+        return "image/png"
+    if _is_webp(image):
+        return "image/webp"
+    return "application/octet-stream"
+
 def get_daily_picture_full(user_id: int, date: str):
     """Get full resolution image for a specific date (on-demand loading)."""
+    image = get_daily_picture_bytes(user_id, date)
+    return _picture_base64(image) if image is not None else None
+
+def get_daily_picture_bytes(user_id: int, date: str) -> Optional[bytes]:
+    """Raw full resolution image bytes for a specific date, without the base64 step."""
     db = get_db()
     try:
         row = db.execute("""
-        SELECT image_base64
-        FROM daily_pictures
-        WHERE user_id = ? AND date = ?
-        ORDER BY created_at DESC
+        SELECT b.image
+        FROM daily_pictures p
+        JOIN daily_picture_blobs b ON b.hash = p.image_hash
+        WHERE p.user_id = ? AND p.date = ?
+        ORDER BY p.created_at DESC
         LIMIT 1
         """, (user_id, date)).fetchone()
 
-        if row:
-            return row['image_base64']
-        return None
+        return bytes(row['image']) if row else None
     finally:
         db.close()
 
@@ -1427,65 +2065,51 @@ def get_friend_picture_full(user_id: int, friend_id: int, date: str):
             return None
 
         row = db.execute("""
-        SELECT image_base64
-        FROM daily_pictures
-        WHERE user_id = ? AND date = ?
-        ORDER BY created_at DESC
+        SELECT b.image
+        FROM daily_pictures p
+        JOIN daily_picture_blobs b ON b.hash = p.image_hash
+        WHERE p.user_id = ? AND p.date = ?
+        ORDER BY p.created_at DESC
         LIMIT 1
         """, (friend_id, date)).fetchone()
 
         if row:
-            return row['image_base64']
+            return _picture_base64(row['image'])
         return None
     finally:
         db.close()
 
 # ========== User Preferences ==========
 
+# @@@ Partial upsert: NULL params mean "not provided" and keep the stored value;
+# the WHERE skips the update (and the updated_at bump) when nothing was provided
+_UPSERT_PREFERENCES_SQL = """
+INSERT INTO user_preferences (user_id, voice_configs_json, meta_prompt, state_config_json, selected_state, timezone)
+VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT(user_id) DO UPDATE SET
+  voice_configs_json = COALESCE(excluded.voice_configs_json, user_preferences.voice_configs_json),
+  meta_prompt = COALESCE(excluded.meta_prompt, user_preferences.meta_prompt),
+  state_config_json = COALESCE(excluded.state_config_json, user_preferences.state_config_json),
+  selected_state = COALESCE(excluded.selected_state, user_preferences.selected_state),
+  timezone = COALESCE(excluded.timezone, user_preferences.timezone),
+  updated_at = CURRENT_TIMESTAMP
+WHERE excluded.voice_configs_json IS NOT NULL OR excluded.meta_prompt IS NOT NULL
+   OR excluded.state_config_json IS NOT NULL OR excluded.selected_state IS NOT NULL
+   OR excluded.timezone IS NOT NULL
+"""
+
 def save_preferences(user_id: int, voice_configs: dict = None, meta_prompt: str = None,
                     state_config: dict = None, selected_state: str = None, timezone: str = None):
-    """Save or update user preferences."""
+    """Save or update user preferences (None leaves a field unchanged)."""
     db = get_db()
     try:
-        # Check if preferences exist
-        existing = db.execute("SELECT user_id FROM user_preferences WHERE user_id = ?", (user_id,)).fetchone()
-
-        if existing:
-            # Update
-            updates = []
-            params = []
-            if voice_configs is not None:
-                updates.append("voice_configs_json = ?")
-                params.append(json.dumps(voice_configs))
-            if meta_prompt is not None:
-                updates.append("meta_prompt = ?")
-                params.append(meta_prompt)
-            if state_config is not None:
-                updates.append("state_config_json = ?")
-                params.append(json.dumps(state_config))
-            if selected_state is not None:
-                updates.append("selected_state = ?")
-                params.append(selected_state)
-            if timezone is not None:
-                updates.append("timezone = ?")
-                params.append(timezone)
-
-            if updates:
-                updates.append("updated_at = CURRENT_TIMESTAMP")
-                params.append(user_id)
-                db.execute(f"UPDATE user_preferences SET {', '.join(updates)} WHERE user_id = ?", params)
-        else:
-            # Insert
-            db.execute("""
-            INSERT INTO user_preferences (user_id, voice_configs_json, meta_prompt, state_config_json, selected_state, timezone)
-            VALUES (?, ?, ?, ?, ?, ?)
-            """, (user_id,
-                  json.dumps(voice_configs) if voice_configs else None,
-                  meta_prompt,
-                  json.dumps(state_config) if state_config else None,
-                  selected_state,
-                  timezone))
-
+        db.execute(_UPSERT_PREFERENCES_SQL, (
+            user_id,
+            _json_dumps(voice_configs) if voice_configs is not None else None,
+            meta_prompt,
+            _json_dumps(state_config) if state_config is not None else None,
+            selected_state,
+            timezone))
         db.commit()
     finally:
         db.close()
@@ -1503,8 +2127,8 @@ def get_preferences(user_id: int):
 
         if row:
             result = dict(row)
-            result['voice_configs'] = json.loads(result['voice_configs_json']) if result['voice_configs_json'] else None
-            result['state_config'] = json.loads(result['state_config_json']) if result['state_config_json'] else None
+            result['voice_configs'] = _json_loads(result['voice_configs_json']) if result['voice_configs_json'] else None
+            result['state_config'] = _json_loads(result['state_config_json']) if result['state_config_json'] else None
             del result['voice_configs_json']
             del result['state_config_json']
             return result
@@ -1516,22 +2140,13 @@ def set_first_login_completed(user_id: int):
     """Mark user's first login as completed."""
     db = get_db()
     try:
-        # Check if preferences exist
-        existing = db.execute("SELECT user_id FROM user_preferences WHERE user_id = ?", (user_id,)).fetchone()
-
-        if existing:
-            # Update existing
-            db.execute("""
-            UPDATE user_preferences
-            SET first_login_completed = 1, updated_at = CURRENT_TIMESTAMP
-            WHERE user_id = ?
-            """, (user_id,))
-        else:
-            # Insert new
-            db.execute("""
-            INSERT INTO user_preferences (user_id, first_login_completed)
-            VALUES (?, 1)
-            """, (user_id,))
+        db.execute("""
+        INSERT INTO user_preferences (user_id, first_login_completed)
+        VALUES (?, 1)
+        ON CONFLICT(user_id) DO UPDATE SET
+          first_login_completed = 1,
+          updated_at = CURRENT_TIMESTAMP
+        """, (user_id,))
 
         db.commit()
     finally:
@@ -1539,6 +2154,25 @@ def set_first_login_completed(user_id: int):
 
 # ========== Analysis Reports ==========
 
+# @@@ Report payloads (JSON + the full notes snapshot) are large, repetitive and
+# never queried in SQL, so they're stored deflated behind a 1-byte tag. Untagged
+# values are legacy TEXT rows (JSON/text never starts with \x01) and pass through.
+_ZLIB_TAG = b'\x01'
+
+def _pack(data: Union[str, bytes, None]) -> Optional[bytes]:
+    """Deflate a str/bytes payload for storage (None stays None)."""
+    if data is None:
+        return None
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return _ZLIB_TAG + zlib.compress(data, 3)
+
+def _unpack(value: Union[str, bytes, None]) -> Union[str, bytes, None]:
+    """Inverse of _pack; legacy uncompressed values are returned unchanged."""
+    if isinstance(value, bytes) and value[:1] == _ZLIB_TAG:
+        return zlib.decompress(value[1:])
+    return value
+
 def save_analysis_report(user_id: int, report_type: str, report_data: dict, all_notes_text: str = None):
     """Save an analysis report."""
     db = get_db()
@@ -1546,7 +2180,7 @@ def save_analysis_report(user_id: int, report_type: str, report_data: dict, all_
         db.execute("""
         INSERT INTO analysis_reports (user_id, report_type, report_data_json, all_notes_text)
         VALUES (?, ?, ?, ?)
-        """, (user_id, report_type, json.dumps(report_data), all_notes_text))
+        """, (user_id, report_type, _pack(_json_dumpb(report_data)), _pack(all_notes_text)))
         db.commit()
     finally:
         db.close()
@@ -1555,21 +2189,20 @@ def get_analysis_reports(user_id: int, limit: int = 10):
     """Get recent analysis reports."""
     db = get_db()
     try:
-        rows = db.execute("""
+        rows = _fetch_tuples(db, """
         SELECT id, report_type, report_data_json, created_at
         FROM analysis_reports
         WHERE user_id = ?
         ORDER BY created_at DESC
         LIMIT ?
-        """, (user_id, limit)).fetchall()
-
-        results = []
-        for row in rows:
-            result = dict(row)
-            result['report_data'] = json.loads(result['report_data_json'])
-            del result['report_data_json']
-            results.append(result)
-        return results
+        """, (user_id, limit))
+
+        # Same keys (and order) dict(row) produced, minus the raw JSON column
+        return [
+            {'id': report_id, 'report_type': report_type, 'created_at': created_at,
+             'report_data': _json_loads(_unpack(report_data_json))}
+            for report_id, report_type, report_data_json, created_at in rows
+        ]
     finally:
         db.close()
 
@@ -1586,21 +2219,51 @@ def import_user_data(user_id: int, sessions: list, pictures: list, preferences:
         preferences: {voice_configs, meta_prompt, state_config, selected_state}
         reports: Optional list of {type, data, allNotes, timestamp}
     """
+    # @@@ Decode/serialize in Python first, then one executemany per table
+    session_rows = [
+        (session['id'], user_id, session.get('name'), _json_dumpb(session['editor_state']),
+         int(_has_text_content(session['editor_state'])))
+        for session in sessions
+    ]
+
+    blob_rows = {}
+    picture_rows = []
+    for picture in pictures:
+        try:
+            image = _decode_picture(picture['image_base64'], strict=False)
+        except ValueError as e:
+            print(f"⚠️ Skipping imported picture for {picture['date']}: {e}")
+            continue
+        image_hash = hashlib.sha256(image).hexdigest()
+        blob_rows[image_hash] = image
+        picture_rows.append((user_id, picture['date'], image_hash, picture.get('prompt')))
+
+    report_rows = [
+        (user_id, report.get('type', 'unknown'), _pack(_json_dumpb(report.get('data', {}))),
+         _pack(report.get('allNotes')))
+        for report in reports or []
+    ]
+
     db = get_db()
     try:
+        db.execute("BEGIN IMMEDIATE")
+
         # Import sessions
-        for session in sessions:
-            db.execute("""
-            INSERT OR REPLACE INTO user_sessions (id, user_id, name, editor_state_json)
-            VALUES (?, ?, ?, ?)
-            """, (session['id'], user_id, session.get('name'), json.dumps(session['editor_state'])))
+        db.executemany("""
+        INSERT OR REPLACE INTO user_sessions (id, user_id, name, editor_state_json, has_text_content)
+        VALUES (?, ?, ?, ?, ?)
+        """, session_rows)
+        _invalidate_daily_notes(db, user_id)
 
-        # Import pictures
-        for picture in pictures:
-            db.execute("""
-            INSERT OR REPLACE INTO daily_pictures (user_id, date, image_base64, prompt)
-            VALUES (?, ?, ?, ?)
-            """, (user_id, picture['date'], picture['image_base64'], picture.get('prompt')))
+        # Import pictures (blobs first - daily_pictures references them)
+        db.executemany(
+            "INSERT OR IGNORE INTO daily_picture_blobs (hash, image) VALUES (?, ?)",
+            blob_rows.items()
+        )
+        db.executemany("""
+        INSERT OR REPLACE INTO daily_pictures (user_id, date, image_hash, prompt)
+        VALUES (?, ?, ?, ?)
+        """, picture_rows)
 
         # Import preferences
         if preferences:
@@ -1609,21 +2272,22 @@ def import_user_data(user_id: int, sessions: list, pictures: list, preferences:
             (user_id, voice_configs_json, meta_prompt, state_config_json, selected_state)
             VALUES (?, ?, ?, ?, ?)
             """, (user_id,
-                  json.dumps(preferences.get('voice_configs')) if preferences.get('voice_configs') else None,
+                  _json_dumps(preferences.get('voice_configs')) if preferences.get('voice_configs') else None,
                   preferences.get('meta_prompt'),
-                  json.dumps(preferences.get('state_config')) if preferences.get('state_config') else None,
+                  _json_dumps(preferences.get('state_config')) if preferences.get('state_config') else None,
                   preferences.get('selected_state')))
 
         # Import analysis reports
-        if reports:
-            for report in reports:
-                db.execute("""
-                INSERT INTO analysis_reports (user_id, report_type, report_data_json, all_notes_text)
-                VALUES (?, ?, ?, ?)
-                """, (user_id, report.get('type', 'unknown'), json.dumps(report.get('data', {})), report.get('allNotes')))
+        db.executemany("""
+        INSERT INTO analysis_reports (user_id, report_type, report_data_json, all_notes_text)
+        VALUES (?, ?, ?, ?)
+        """, report_rows)
 
         db.commit()
         print(f"✅ Imported {len(sessions)} sessions, {len(pictures)} pictures, {len(reports or [])} reports for user {user_id}")
+    except Exception:
+        db.rollback()
+        raise
     finally:
         db.close()
 
@@ -1914,20 +2578,20 @@ def get_friend_timeline(user_id: int, friend_id: int, limit: int = 30) -> list:
             return None  # Not friends, no access
 
         # Get friend's timeline pictures (thumbnails)
-        rows = db.execute("""
-        SELECT date, COALESCE(thumbnail_base64, image_base64) as base64, prompt, created_at
-        FROM daily_pictures
+        rows = _fetch_tuples(db, f"""
+        SELECT date, {_PICTURE_PREVIEW_SQL} as base64, prompt, created_at
+        FROM daily_pictures p
         WHERE user_id = ?
         ORDER BY date DESC
         LIMIT ?
-        """, (friend_id, limit)).fetchall()
+        """, (friend_id, limit))
 
         return [{
-            "date": row['date'],
-            "base64": row['base64'],
-            "prompt": row['prompt'],
-            "created_at": row['created_at']
-        } for row in rows]
+            "date": date,
+            "base64": _picture_base64(preview),
+            "prompt": prompt,
+            "created_at": created_at
+        } for date, preview, prompt, created_at in rows]
     finally:
         db.close()
 
@@ -1937,22 +2601,22 @@ def get_daily_pictures_range(user_id: int, start_date: Optional[str], end_date:
     """
     db = get_db()
     try:
-        rows = db.execute("""
-        SELECT date, COALESCE(thumbnail_base64, image_base64) as base64, prompt, created_at
-        FROM daily_pictures
+        rows = _fetch_tuples(db, f"""
+        SELECT date, {_PICTURE_PREVIEW_SQL} as base64, prompt, created_at
+        FROM daily_pictures p
         WHERE user_id = ?
           AND (? IS NULL OR date(date) >= ?)
           AND (? IS NULL OR date(date) <= ?)
         ORDER BY date DESC
         LIMIT ?
-        """, (user_id, start_date, start_date, end_date, end_date, limit)).fetchall()
+        """, (user_id, start_date, start_date, end_date, end_date, limit))
 
         return [{
-            "date": row['date'],
-            "base64": row['base64'],
-            "prompt": row['prompt'],
-            "created_at": row['created_at']
-        } for row in rows]
+            "date": date,
+            "base64": _picture_base64(preview),
+            "prompt": prompt,
+            "created_at": created_at
+        } for date, preview, prompt, created_at in rows]
     finally:
         db.close()
 
@@ -0,0 +1,117 @@
+"""
+In-memory LRU cache for deterministic LLM calls.
+
+Report analyses and the picture-description step are pure functions of
+(model, prompt): re-running them on unchanged notes returns what the last
+call did. Entries are keyed by a SHA-256 of the request, expire after a
+TTL and are evicted least-recently-used. LLM_CACHE_SIZE=0 (or
+LLM_CACHE_TTL_SECONDS=0) turns the cache off.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+
+def _env_int(name: str, default: int) -> int:
+    raw = os.environ.get(name, str(default))
+    try:
+        value = int(raw)
+    except ValueError:
+        raise RuntimeError(f"{name} must be an integer, got {raw!r}")
+    if value < 0:
+        raise RuntimeError(f"{name} must not be negative, got {value}")
+    return value
+
+
+LLM_CACHE_SIZE = _env_int("LLM_CACHE_SIZE", 256)
+LLM_CACHE_TTL_SECONDS = _env_int("LLM_CACHE_TTL_SECONDS", 3600)
+
+
+def cache_key(**request) -> str:
+    """Stable key for an LLM request (e.g. kind=..., model=..., prompt=...)."""
+    payload = json.dumps(request, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """Thread-safe LRU + TTL cache (callers run in worker threads)."""
+
+    def __init__(self, max_size: int, ttl_seconds: int):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0 and self.ttl_seconds > 0
+
+    def get(self, key: str) -> tuple[bool, Any]:
+        """Returns (found, value)."""
+        if not self.enabled:
+            return False, None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key: str, value: Any):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get_or_call(self, key: str, call: Callable[[], Any],
+                    cacheable: Optional[Callable[[Any], bool]] = None) -> Any:
+        """
+        Return the cached value for key, or run call() and cache its result.
+
+        Args:
+            key: From cache_key()
+            call: Makes the LLM request
+            cacheable: Predicate on the result; failures (False) are not cached
+
+        @@@ Concurrent misses on the same key both call through - the LLM
+        round-trip isn't held under the lock
+        """
+        found, value = self.get(key)
+        if found:
+            return value
+        value = call()
+        if cacheable is None or cacheable(value):
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+llm_cache = LLMCache(LLM_CACHE_SIZE, LLM_CACHE_TTL_SECONDS)
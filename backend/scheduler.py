@@ -49,15 +49,13 @@ async def generate_for_user(user_id: int, text: str, date: str, timezone: str) -
             )
         )
 
-        if result and 'image_base64' in result:
-            # Save to database with explicit date
-            database.save_daily_picture(
-                user_id=user_id,
-                date=date,
-                image_base64=result['image_base64'],
-                thumbnail_base64=result.get('thumbnail_base64'),
-                prompt=result.get('prompt')
-            )
+        # @@@ generate_daily_picture (dry_run=False) already saved the picture from its
+        # executor thread - saving again here blocked the event loop on a duplicate
+        # write, and for skipped results overwrote the full image with its preview
+        if result and result.get('skipped'):
+            print(f"⏭️  User {user_id}: Skipped {date} ({result.get('reason')})")
+            return {"success": True, "skipped": True, "user_id": user_id, "date": date}
+        if result and result.get('image_base64'):
             print(f"✅ User {user_id}: Successfully generated and saved image for {date}")
             return {"success": True, "user_id": user_id, "date": date}
         else:
@@ -88,39 +86,28 @@ async def generate_timeline_images_for_date(target_date: str, timezone: str = 'A
     print(f"{'='*60}\n")
 
     try:
-        # Step 1: Get users with activity on this date
-        user_ids = database.get_users_with_activity_on_date(target_date, timezone)
-        print(f"📊 Found {len(user_ids)} users with activity on {target_date}")
+        # Steps 1+2: Every active user's text for this date in one query
+        # (arguments only - coroutines are created under the semaphore in step 3)
+        tasks = database.get_users_text_on_date(target_date, timezone)
+        print(f"📊 Found {len(tasks)} users with activity on {target_date}")
 
-        if not user_ids:
+        if not tasks:
             print("ℹ️  No users with activity, exiting")
             return {"total": 0, "success": 0, "failed": 0, "skipped": 0}
 
-        # Step 2: Extract text for each user
-        tasks = []
-        for user_id in user_ids:
-            try:
-                text = database.extract_text_from_sessions_on_date(user_id, target_date, timezone)
-                if text.strip():
-                    # Create async task with semaphore for rate limiting
-                    task = generate_for_user(user_id, text, target_date, timezone)
-                    tasks.append(task)
-                else:
-                    print(f"⏭️  User {user_id}: No text content, skipping")
-            except Exception as e:
-                print(f"❌ User {user_id}: Error extracting text: {e}")
-                continue
-
         print(f"🚀 Starting generation for {len(tasks)} users (batched: {max_concurrent} concurrent)")
 
         # Step 3: Run with rate limiting (semaphore)
         semaphore = asyncio.Semaphore(max_concurrent)
 
-        async def bounded_generate(task):
+        async def bounded_generate(user_id: int, text: str):
             async with semaphore:
-                return await task
+                return await generate_for_user(user_id, text, target_date, timezone)
 
-        results = await asyncio.gather(*[bounded_generate(task) for task in tasks], return_exceptions=True)
+        results = await asyncio.gather(
+            *[bounded_generate(user_id, text) for user_id, text in tasks],
+            return_exceptions=True,
+        )
 
         # Step 4: Summarize results
         success_count = sum(1 for r in results if isinstance(r, dict) and r.get('success') and not r.get('skipped'))
@@ -175,3 +162,28 @@ async def daily_generation_job(timezone: str = 'Asia/Shanghai'):
     """
     target_date = get_previous_day(timezone)
     await generate_timeline_images_for_date(target_date, timezone)
+
+    # @@@ Nightly full ANALYZE once the day's writes are in (quietest time of day)
+    try:
+        stats = database.optimize_db(full_analyze=True)
+        print(f"🧹 Nightly ANALYZE done (WAL: {stats['checkpointed']}/{stats['wal_frames']} frames checkpointed)")
+    except Exception as e:
+        print(f"⚠️ Nightly ANALYZE failed: {e}")
+
+
+# PRAGMA optimize is cheap when stats are fresh; 15 min keeps the WAL small too
+SQLITE_MAINTENANCE_MINUTES = 15
+
+
+def sqlite_maintenance_job():
+    """
+    Frequent light maintenance: PRAGMA optimize + passive WAL checkpoint.
+
+    Called every SQLITE_MAINTENANCE_MINUTES by APScheduler (in a worker thread).
+    """
+    try:
+        stats = database.optimize_db()
+        if stats['busy']:
+            print(f"⚠️ WAL checkpoint incomplete ({stats['checkpointed']}/{stats['wal_frames']} frames) - readers active")
+    except Exception as e:
+        print(f"⚠️ SQLite maintenance failed: {e}")
@@ -9,9 +9,16 @@ if hasattr(time, "tzset"):
     time.tzset()
 
 import asyncio
+import json
+import logging
+import queue
+import random
+import shutil
+import threading
 from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
 import httpx
-from fastapi import FastAPI, HTTPException, Depends, Header, WebSocket
+from fastapi import FastAPI, HTTPException, Depends, Header, WebSocket, BackgroundTasks, Response
 from fastapi.middleware.cors import CORSMiddleware
 from polycli.orchestration.session_registry import session_def, get_registry
 from polycli.integrations.fastapi import mount_control_panel
@@ -19,6 +26,7 @@ from polycli import PolyAgent
 from stateless_analyzer import analyze_stateless
 from speech_recognition import init_speech_recognition
 import config
+from llm_cache import cache_key, llm_cache
 from typing import Optional, List
 from pydantic import BaseModel
 
@@ -26,6 +34,22 @@ from pydantic import BaseModel
 import database
 import auth
 
+try:
+    import orjson
+    from fastapi.responses import ORJSONResponse
+
+    _json_loads = orjson.loads
+
+    class _JSONResponse(ORJSONResponse):
+        """orjson rendering; OPT_NON_STR_KEYS keeps int dict keys working like json.dumps."""
+
+        def render(self, content) -> bytes:
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+except ImportError:  # orjson is an optional speed-up
+    from fastapi.responses import JSONResponse as _JSONResponse
+
+    _json_loads = json.loads
+
 SUPPORTED_LANGUAGES = {"en", "zh"}
 DEFAULT_LANGUAGE = "en"
 BACKEND_VERSION = os.environ.get("BACKEND_VERSION", "unknown")
@@ -83,6 +107,27 @@ def language_instruction(language_code: str, detail: str = "") -> str:
     return base
 
 
+# @@@ PolyAgent() scans PATH for the claude/qwen/codex CLIs on every construction
+# (~0.2 ms, most of its cost). Agents keep their own message history (and the
+# control panel can inject into it), so one instance can't serve several
+# requests - each call still gets a fresh agent, only the scan is done once.
+_CLI_TOOLS = {
+    "_claude_cmd": shutil.which("claude"),
+    "_qwen_cmd": shutil.which("qwen"),
+    "_codex_cmd": shutil.which("codex"),
+}
+
+
+class _RequestAgent(PolyAgent):
+    def _detect_cli_tools(self):
+        self.__dict__.update(_CLI_TOOLS)
+
+
+def _new_agent(agent_id: str) -> PolyAgent:
+    """Fresh per-request agent (empty history) without re-scanning PATH."""
+    return _RequestAgent(id=agent_id)
+
+
 # ========== Session Definitions (PolyCLI) ==========
 
 
@@ -124,7 +169,7 @@ def get_writing_suggestion(
     print(f"🎭 Selected voice: {voice_info['name']} ({voice_key})")
     print(f"📚 Selected from {len(voices)} enabled voices")
 
-    agent = PolyAgent(id="writing-suggester")
+    agent = _new_agent("writing-suggester")
 
     # Build system prompt - voice gives inspiration, not continuation
     system_prompt = f"""You are {voice_info["name"]}, an inner voice persona.
@@ -244,9 +289,11 @@ def chat_with_voice(
             "error": f"Voice {voice_id} not found in your enabled decks. Please enable it in the Decks tab.",
         }
 
-    agent = PolyAgent(id=f"voice-chat-{voice_name.lower()}")
+    agent = _new_agent(f"voice-chat-{voice_name.lower()}")
 
-    # Build system prompt for this voice
+    # @@@ Stable across every turn of a conversation -> sent as the system message.
+    # Providers cache identical prompt prefixes automatically, so keep anything
+    # that changes per turn (state, history, the new message) out of this block.
     system_prompt = f"""You are {voice_name}, an inner voice archetype from Disco Elysium.
 
 Your character: {voice_config.get("systemPrompt", "")}
@@ -272,15 +319,15 @@ Your initial comment was about this text. Keep this context in mind when respond
 Additional instructions:
 {meta_prompt.strip()}"""
 
-    # Add state prompt if available
+    # Volatile suffix: state, conversation history and the new message
+    prompt = ""
     if state_prompt and state_prompt.strip():
-        system_prompt += f"""
+        prompt += f"""User's current state:
+{state_prompt.strip()}
 
-User's current state:
-{state_prompt.strip()}"""
+"""
 
-    # Build full prompt with conversation history
-    prompt = system_prompt + "\n\nConversation history:\n"
+    prompt += "Conversation history:\n"
 
     # Add conversation history
     for msg in conversation_history:
@@ -291,7 +338,13 @@ User's current state:
     prompt += f"\n\nUser: {user_message}\n\n{voice_name}:"
 
     # Get response from LLM
-    result = agent.run(prompt, model=config.VOICE_CHAT_MODEL, cli="no-tools", tracked=True)
+    result = agent.run(
+        prompt,
+        model=config.VOICE_CHAT_MODEL,
+        cli="no-tools",
+        system_prompt=system_prompt,
+        tracked=True,
+    )
 
     if not result.is_success or not result.content:
         response = "..."
@@ -346,7 +399,7 @@ def analyze_text(
         f"📚 Loaded {len(voices)} enabled voices from deck system: {list(voices.keys()) if voices else 'None (will use defaults)'}"
     )
 
-    agent = PolyAgent(id="voice-analyzer")
+    agent = _new_agent("voice-analyzer")
 
     # Get voices from stateless analyzer
     result = analyze_stateless(
@@ -369,28 +422,7 @@ def analyze_text(
     }
 
 
-@session_def(
-    name="Analyze Echoes",
-    description="Find recurring themes and topics in all user notes",
-    params={
-        "user_id": {"type": "int"},
-        "language": {"type": "str"},
-    },
-    category="Analysis",
-)
-def analyze_echoes(user_id: int, language: str = "en"):
-    """Analyze recurring themes and topics across all notes."""
-    notes = _load_all_notes_text(user_id)
-    if not notes.strip():
-        return {"echoes": []}
-    print(f"\n{'=' * 60}")
-    print(f"🔄 analyze_echoes() called")
-    language_code = normalize_language_code(language)
-    print(f"   Language: {language_code}")
-    print(f"{'=' * 60}\n")
-
-    agent = PolyAgent(id="echoes-analyzer")
-
+def _echoes_prompt(notes: str, language_code: str) -> str:
     prompt = f"""Analyze these personal notes and identify recurring themes, topics, or concerns that keep appearing.
 
 Notes:
@@ -411,43 +443,10 @@ Format as a JSON array:
 
 Return ONLY the JSON array, no other text."""
     prompt += f"\n\n{language_instruction(language_code, 'All titles, descriptions, and examples should use this language. Keep the JSON keys the same.')}"
+    return prompt
 
-    result = agent.run(prompt, model=config.ECHO_ANALYSIS_MODEL, cli="no-tools", tracked=True)
-
-    if not result.is_success or not result.content:
-        return {"echoes": []}
-
-    try:
-        import json
-
-        echoes = json.loads(result.content.strip())
-        return {"echoes": echoes}
-    except:
-        return {"echoes": []}
-
-
-@session_def(
-    name="Analyze Traits",
-    description="Identify personality traits and characteristics from user notes",
-    params={
-        "user_id": {"type": "int"},
-        "language": {"type": "str"},
-    },
-    category="Analysis",
-)
-def analyze_traits(user_id: int, language: str = "en"):
-    """Analyze personality traits from all notes."""
-    notes = _load_all_notes_text(user_id)
-    if not notes.strip():
-        return {"traits": []}
-    print(f"\n{'=' * 60}")
-    print(f"👤 analyze_traits() called")
-    language_code = normalize_language_code(language)
-    print(f"   Language: {language_code}")
-    print(f"{'=' * 60}\n")
-
-    agent = PolyAgent(id="traits-analyzer")
 
+def _traits_prompt(notes: str, language_code: str) -> str:
     prompt = f"""Analyze these personal notes and identify personality traits and characteristics.
 
 Notes:
@@ -468,19 +467,108 @@ Format as a JSON array:
 
 Return ONLY the JSON array, no other text."""
     prompt += f"\n\n{language_instruction(language_code, 'Use this language for trait names, explanations, and evidence (JSON keys stay in English).')}"
+    return prompt
 
-    result = agent.run(prompt, model=config.TRAIT_ANALYSIS_MODEL, cli="no-tools", tracked=True)
 
-    if not result.is_success or not result.content:
-        return {"traits": []}
+def _patterns_prompt(notes: str, language_code: str) -> str:
+    prompt = f"""Analyze these personal notes and identify behavioral patterns or habits.
 
-    try:
-        import json
+Notes:
+---
+{notes}
+---
+
+Identify 3-5 behavioral patterns or habits. For each pattern:
+- Give it a descriptive name
+- Describe the pattern
+- Note the frequency/context when it appears
+
+Format as a JSON array:
+[
+  {{"pattern": "...", "description": "...", "frequency": "..."}},
+  ...
+]
+
+Return ONLY the JSON array, no other text."""
+    prompt += f"\n\n{language_instruction(language_code, 'Use this language for pattern names, descriptions, and frequency notes (JSON keys stay in English).')}"
+    return prompt
+
+
+# Report analysis kind -> (agent id, prompt builder, model)
+_REPORT_ANALYSES = {
+    "echoes": ("echoes-analyzer", _echoes_prompt, config.ECHO_ANALYSIS_MODEL),
+    "traits": ("traits-analyzer", _traits_prompt, config.TRAIT_ANALYSIS_MODEL),
+    "patterns": ("patterns-analyzer", _patterns_prompt, config.PATTERN_ANALYSIS_MODEL),
+}
+
+
+def _run_report_analysis(kind: str, notes: str, language_code: str) -> list:
+    """Run one report analysis LLM call. Returns the parsed JSON array ([] on failure)."""
+    agent_id, build_prompt, model = _REPORT_ANALYSES[kind]
+    prompt = build_prompt(notes, language_code)
 
-        traits = json.loads(result.content.strip())
-        return {"traits": traits}
-    except:
+    def call():
+        agent = _new_agent(agent_id)
+        result = agent.run(prompt, model=model, cli="no-tools", tracked=True)
+
+        if not result.is_success or not result.content:
+            return None
+
+        try:
+            return _json_loads(result.content.strip())
+        except:
+            return None
+
+    # @@@ Same notes + language -> same prompt: reuse the last answer (failures aren't cached)
+    key = cache_key(kind=kind, model=model, prompt=prompt)
+    parsed = llm_cache.get_or_call(key, call, cacheable=lambda value: value is not None)
+    return parsed if parsed is not None else []
+
+
+@session_def(
+    name="Analyze Echoes",
+    description="Find recurring themes and topics in all user notes",
+    params={
+        "user_id": {"type": "int"},
+        "language": {"type": "str"},
+    },
+    category="Analysis",
+)
+def analyze_echoes(user_id: int, language: str = "en"):
+    """Analyze recurring themes and topics across all notes."""
+    notes = _load_all_notes_text(user_id)
+    if not notes.strip():
+        return {"echoes": []}
+    print(f"\n{'=' * 60}")
+    print(f"🔄 analyze_echoes() called")
+    language_code = normalize_language_code(language)
+    print(f"   Language: {language_code}")
+    print(f"{'=' * 60}\n")
+
+    return {"echoes": _run_report_analysis("echoes", notes, language_code)}
+
+
+@session_def(
+    name="Analyze Traits",
+    description="Identify personality traits and characteristics from user notes",
+    params={
+        "user_id": {"type": "int"},
+        "language": {"type": "str"},
+    },
+    category="Analysis",
+)
+def analyze_traits(user_id: int, language: str = "en"):
+    """Analyze personality traits from all notes."""
+    notes = _load_all_notes_text(user_id)
+    if not notes.strip():
         return {"traits": []}
+    print(f"\n{'=' * 60}")
+    print(f"👤 analyze_traits() called")
+    language_code = normalize_language_code(language)
+    print(f"   Language: {language_code}")
+    print(f"{'=' * 60}\n")
+
+    return {"traits": _run_report_analysis("traits", notes, language_code)}
 
 
 @session_def(
@@ -505,41 +593,67 @@ def analyze_patterns(
     print(f"   Language: {language_code}")
     print(f"{'=' * 60}\n")
 
-    agent = PolyAgent(id="patterns-analyzer")
+    return {"patterns": _run_report_analysis("patterns", notes, language_code)}
 
-    prompt = f"""Analyze these personal notes and identify behavioral patterns or habits.
 
-Notes:
----
-{notes}
----
+# @@@ One pooled HTTP client for the image API, shared by every caller thread
+# (PolyCLI sessions, the scheduler's executor). Keep-alive connections are
+# reused instead of a new TCP+TLS handshake per request. httpx.Client is
+# thread-safe; created on first use so scripts importing server pay nothing.
+_http_client: Optional[httpx.Client] = None
+_http_client_lock = threading.Lock()
 
-Identify 3-5 behavioral patterns or habits. For each pattern:
-- Give it a descriptive name
-- Describe the pattern
-- Note the frequency/context when it appears
+# Sized for the fan-out: scheduler batches, PolyCLI session workers and
+# endpoint threads together stay well under 100 in-flight calls. Idle
+# connections live 30s (httpx default 5s) so they survive the gap between
+# the description call, image post-processing and the next user's call.
+HTTP_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=32, keepalive_expiry=30.0)
+# Slow generations need long read timeouts, but an unreachable host should fail fast
+HTTP_CONNECT_TIMEOUT = 10.0
 
-Format as a JSON array:
-[
-  {{"pattern": "...", "description": "...", "frequency": "..."}},
-  ...
-]
 
-Return ONLY the JSON array, no other text."""
-    prompt += f"\n\n{language_instruction(language_code, 'Use this language for pattern names, descriptions, and frequency notes (JSON keys stay in English).')}"
+def _http_timeout(seconds: float) -> httpx.Timeout:
+    """Per-call timeout: `seconds` to read/write/wait for a connection, bounded connect."""
+    return httpx.Timeout(seconds, connect=min(seconds, HTTP_CONNECT_TIMEOUT))
 
-    result = agent.run(prompt, model=config.PATTERN_ANALYSIS_MODEL, cli="no-tools", tracked=True)
 
-    if not result.is_success or not result.content:
-        return {"patterns": []}
+def get_http_client() -> httpx.Client:
+    """Get the shared image API client (created on first use)."""
+    global _http_client
+    client = _http_client
+    if client is None:
+        with _http_client_lock:
+            if _http_client is None:
+                _http_client = httpx.Client(limits=HTTP_LIMITS)
+            client = _http_client
+    return client
 
-    try:
-        import json
 
-        patterns = json.loads(result.content.strip())
-        return {"patterns": patterns}
-    except:
-        return {"patterns": []}
+def close_http_client():
+    """Close the shared client's connections (the next call opens a new one)."""
+    global _http_client
+    with _http_client_lock:
+        client, _http_client = _http_client, None
+    if client is not None:
+        client.close()
+
+
+def _is_retryable_status(status_code: int) -> bool:
+    """Timeouts, rate limits and server errors are worth another attempt."""
+    return status_code in (408, 429) or status_code >= 500
+
+
+def _sleep_before_retry(attempt: int):
+    """
+    Exponential backoff with jitter after a failed attempt (1-based).
+
+    @@@ Full range 0.5-1.5x of min(cap, base * 2^(attempt-1)): users whose
+    midnight generations fail together don't all retry in the same second
+    """
+    delay = min(config.IMAGE_RETRY_BACKOFF_CAP, config.IMAGE_RETRY_BACKOFF_BASE * 2 ** (attempt - 1))
+    delay *= random.uniform(0.5, 1.5)
+    print(f"⏳ Retrying in {delay:.1f} seconds...")
+    time.sleep(delay)
 
 
 def _today_in_tz(tz_name: str) -> str:
@@ -597,7 +711,7 @@ def _generate_picture_for_date(
     print(f"   Target date: {target_date}")
     print(f"{'=' * 60}\n")
 
-    import requests
+    http = get_http_client()
 
     # @@@ Fetch recent prompts to avoid duplication
     recent_prompts_text = ""
@@ -656,31 +770,37 @@ Examples of BAD descriptions (TOO COMPLEX):
 
 Return ONLY the minimal image description, no other text."""
 
-    print("🧠 Creating image description from notes with Claude Haiku...")
+    def describe() -> str:
+        print("🧠 Creating image description from notes with Claude Haiku...")
+
+        claude_response = http.post(
+            f"{config.IMAGE_API_ENDPOINT}/chat/completions",
+            headers=config.IMAGE_API_HEADERS,
+            json={
+                "model": config.IMAGE_DESCRIPTION_MODEL,
+                "messages": [{"role": "user", "content": description_prompt}],
+                "max_tokens": config.IMAGE_DESCRIPTION_MAX_TOKENS,
+            },
+            timeout=_http_timeout(config.IMAGE_DESCRIPTION_TIMEOUT),
+        )
 
-    claude_response = requests.post(
-        f"{config.IMAGE_API_ENDPOINT}/chat/completions",
-        headers={
-            "Authorization": f"Bearer {config.IMAGE_API_KEY}",
-            "Content-Type": "application/json",
-        },
-        json={
-            "model": config.IMAGE_DESCRIPTION_MODEL,
-            "messages": [{"role": "user", "content": description_prompt}],
-            "max_tokens": config.IMAGE_DESCRIPTION_MAX_TOKENS,
-        },
-        timeout=config.IMAGE_DESCRIPTION_TIMEOUT,
-    )
+        if claude_response.status_code != 200:
+            return ""
 
-    if claude_response.status_code != 200:
-        return {"image_base64": None, "error": "Failed to create image description", "date": target_date}
+        claude_data = claude_response.json()
+        return (
+            claude_data.get("choices", [{}])[0]
+            .get("message", {})
+            .get("content", "")
+            .strip()
+        )
 
-    claude_data = claude_response.json()
-    image_description = (
-        claude_data.get("choices", [{}])[0]
-        .get("message", {})
-        .get("content", "")
-        .strip()
+    # @@@ Cached by prompt (notes + recent prompts): a retry after a failed image
+    # call reuses the description; a saved picture changes the recent prompts
+    image_description = llm_cache.get_or_call(
+        cache_key(kind="image_description", model=config.IMAGE_DESCRIPTION_MODEL, prompt=description_prompt),
+        describe,
+        cacheable=bool,
     )
 
     if not image_description:
@@ -690,10 +810,7 @@ Return ONLY the minimal image description, no other text."""
 
     # Step 2: Generate image from description with retry logic
     url = f"{config.IMAGE_API_ENDPOINT}/chat/completions"
-    headers = {
-        "Authorization": f"Bearer {config.IMAGE_API_KEY}",
-        "Content-Type": "application/json",
-    }
+    headers = config.IMAGE_API_HEADERS
 
     payload = {
         "model": config.IMAGE_GENERATION_MODEL,
@@ -709,20 +826,18 @@ Return ONLY the minimal image description, no other text."""
                 + (attempt - 1) * config.IMAGE_RETRY_TIMEOUT_INCREMENT
             )
             print(f"🎨 Generating image (attempt {attempt}/{config.IMAGE_RETRY_MAX_ATTEMPTS}, timeout={timeout_seconds}s)...")
-            response = requests.post(
+            response = http.post(
                 url,
                 headers=headers,
                 json=payload,
-                timeout=timeout_seconds,
+                timeout=_http_timeout(timeout_seconds),
             )
 
             if response.status_code != 200:
                 print(f"❌ Error: {response.status_code}")
-                if attempt < config.IMAGE_RETRY_MAX_ATTEMPTS:
-                    print("⏳ Retrying in 2 seconds...")
-                    import time
-
-                    time.sleep(2)
+                # 4xx (bad request, auth, quota) won't change on retry; 408/429/5xx may
+                if _is_retryable_status(response.status_code) and attempt < config.IMAGE_RETRY_MAX_ATTEMPTS:
+                    _sleep_before_retry(attempt)
                     continue
                 return {"image_base64": None, "error": "Image generation failed", "date": target_date}
 
@@ -762,37 +877,31 @@ Return ONLY the minimal image description, no other text."""
                             # Full JPEG (quality 85)
                             full_output = BytesIO()
                             img.save(full_output, format="JPEG", quality=85, optimize=True)
-                            full_jpeg = base64.b64encode(full_output.getvalue()).decode("utf-8")
-
-                            # Thumbnail JPEG (400px width, quality 60)
-                            thumb_width = 400
-                            thumb_height = int(img.height * (thumb_width / img.width))
-                            thumb_img = img.resize((thumb_width, thumb_height), Image.Resampling.LANCZOS)
+                            full_jpeg = full_output.getvalue()
 
-                            thumb_output = BytesIO()
-                            thumb_img.save(thumb_output, format="JPEG", quality=60, optimize=True)
-                            thumb_jpeg = base64.b64encode(thumb_output.getvalue()).decode("utf-8")
+                            # Thumbnail: WebP from the decoded image, in the format save_daily_picture stores
+                            thumb_webp = database.make_thumbnail(img) or full_jpeg
 
                             print("✅ Image generated successfully")
-                            print(f"   Original PNG: {len(base64_data)} chars")
-                            print(f"   Full JPEG: {len(full_jpeg)} chars ({100 * len(full_jpeg) / len(base64_data):.1f}%)")
-                            print(f"   Thumbnail: {len(thumb_jpeg)} chars ({100 * len(thumb_jpeg) / len(base64_data):.1f}%)")
+                            print(f"   Original PNG: {len(img_bytes)} bytes")
+                            print(f"   Full JPEG: {len(full_jpeg)} bytes ({100 * len(full_jpeg) / len(img_bytes):.1f}%)")
+                            print(f"   Thumbnail: {len(thumb_webp)} bytes ({100 * len(thumb_webp) / len(img_bytes):.1f}%)")
 
-                            result = {
-                                "image_base64": full_jpeg,
-                                "thumbnail_base64": thumb_jpeg,
-                                "prompt": image_description,
-                                "date": target_date,
-                            }
+                            # @@@ Raw bytes go to the DB (BLOB); base64 only for the JSON response
                             if not dry_run:
                                 database.save_daily_picture(
                                     user_id=user_id,
                                     date=target_date,
                                     image_base64=full_jpeg,
                                     prompt=image_description,
-                                    thumbnail_base64=thumb_jpeg,
+                                    thumbnail_base64=thumb_webp,
                                 )
-                            return result
+                            return {
+                                "image_base64": base64.b64encode(full_jpeg).decode("ascii"),
+                                "thumbnail_base64": base64.b64encode(thumb_webp).decode("ascii"),
+                                "prompt": image_description,
+                                "date": target_date,
+                            }
                         except Exception as e:
                             print(f"⚠️ JPEG conversion failed: {e}, using original PNG")
                             result = {
@@ -813,19 +922,14 @@ Return ONLY the minimal image description, no other text."""
 
             if attempt < config.IMAGE_RETRY_MAX_ATTEMPTS:
                 print("⚠️ No image in response, retrying...")
-                import time
-
-                time.sleep(2)
+                _sleep_before_retry(attempt)
                 continue
             return {"image_base64": None, "error": "No image in response", "date": target_date}
 
         except Exception as e:
             print(f"❌ Exception on attempt {attempt}: {e}")
             if attempt < config.IMAGE_RETRY_MAX_ATTEMPTS:
-                print("⏳ Retrying in 2 seconds...")
-                import time
-
-                time.sleep(2)
+                _sleep_before_retry(attempt)
                 continue
             return {"image_base64": None, "error": str(e), "date": target_date}
 
@@ -879,6 +983,7 @@ app = FastAPI(
     title="Ink & Memory API",
     description="Voice analysis and creative generation API",
     version="2.0.0",
+    default_response_class=_JSONResponse,
 )
 
 print(f"🧾 Backend version: {BACKEND_VERSION}")
@@ -922,10 +1027,54 @@ async def startup_scheduler():
         replace_existing=True,
     )
 
+    timeline_gen_scheduler.add_job(
+        timeline_scheduler.sqlite_maintenance_job,
+        "interval",
+        minutes=timeline_scheduler.SQLITE_MAINTENANCE_MINUTES,
+        id="sqlite_maintenance",
+        name="PRAGMA optimize + WAL checkpoint",
+        replace_existing=True,
+    )
+
     timeline_gen_scheduler.start()
     print("✅ Scheduler started - next run at midnight (00:00 Asia/Shanghai)\n")
 
 
+# @@@ Auth log records (e.g. rejected tokens) go through a queue so request
+# threads never block on the stderr write; a listener thread does the I/O
+_auth_log_queue = queue.SimpleQueue()
+_auth_log_handler = QueueHandler(_auth_log_queue)
+_auth_log_listener = QueueListener(_auth_log_queue, logging.StreamHandler())
+
+
+@app.on_event("startup")
+def startup_auth_logging():
+    """Route the auth logger through the background queue listener."""
+    auth.logger.addHandler(_auth_log_handler)
+    auth.logger.setLevel(logging.INFO)
+    auth.logger.propagate = False
+    _auth_log_listener.start()
+
+
+@app.on_event("shutdown")
+def shutdown_auth_logging():
+    """Flush queued auth log records and detach the handler."""
+    auth.logger.removeHandler(_auth_log_handler)
+    _auth_log_listener.stop()
+
+
+@app.on_event("startup")
+def startup_bcrypt_pool():
+    """Start the bcrypt worker pool used by register/login."""
+    auth.start_bcrypt_pool()
+
+
+@app.on_event("shutdown")
+def shutdown_bcrypt_pool():
+    """Stop the bcrypt worker pool."""
+    auth.shutdown_bcrypt_pool()
+
+
 @app.on_event("shutdown")
 async def shutdown_scheduler():
     """Shutdown the scheduler gracefully."""
@@ -934,6 +1083,18 @@ async def shutdown_scheduler():
     print("✅ Scheduler shutdown complete\n")
 
 
+@app.on_event("shutdown")
+def shutdown_http_client():
+    """Close the shared image API client's pooled connections."""
+    close_http_client()
+
+
+@app.on_event("shutdown")
+def shutdown_database():
+    """Close the pooled SQLite connection of the shutdown thread."""
+    database.close_db()
+
+
 # ========== Request/Response Models ==========
 
 
@@ -1014,7 +1175,7 @@ def root():
 
 
 @app.post("/api/register", response_model=TokenResponse)
-def register(request: RegisterRequest):
+async def register(request: RegisterRequest):
     """
     Register a new user.
 
@@ -1030,18 +1191,18 @@ def register(request: RegisterRequest):
         )
 
     # Hash password
-    password_hash = auth.hash_password(request.password)
+    password_hash = await auth.ahash_password(request.password)
 
     # Create user
     try:
-        user_id = database.create_user(
-            request.email, password_hash, request.display_name
+        user_id = await asyncio.to_thread(
+            database.create_user, request.email, password_hash, request.display_name
         )
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
     # @@@ Auto-fork all system decks for new user
-    database.auto_fork_system_decks(user_id)
+    await asyncio.to_thread(database.auto_fork_system_decks, user_id)
 
     # Generate token
     token = auth.create_access_token(user_id, request.email)
@@ -1056,26 +1217,38 @@ def register(request: RegisterRequest):
     }
 
 
+async def _upgrade_password_hash(user_id: int, password: str):
+    """Re-hash a password with the current bcrypt cost."""
+    new_hash = await auth.ahash_password(password)
+    await asyncio.to_thread(database.update_user_password_hash, user_id, new_hash)
+    print(f"🔐 Upgraded password hash for user {user_id}")
+
+
 @app.post("/api/login", response_model=TokenResponse)
-def login(request: LoginRequest):
+async def login(request: LoginRequest, background_tasks: BackgroundTasks):
     """
     Login with email and password.
 
     Returns JWT token and user info.
     """
     # Get user by email
-    user = database.get_user_by_email(request.email)
+    user = await asyncio.to_thread(database.get_user_by_email, request.email)
     if not user:
         raise HTTPException(status_code=401, detail="Invalid email or password")
 
-    # Verify password
-    if not auth.verify_password(request.password, user["password_hash"]):
+    # Verify password (bcrypt runs in the worker pool, off the event loop)
+    password_hash = user["password_hash"].encode("utf-8")
+    if not await auth.averify_password(request.password.encode("utf-8"), password_hash):
         raise HTTPException(status_code=401, detail="Invalid email or password")
 
+    # @@@ Upgrade hashes created with a lower BCRYPT_ROUNDS after responding
+    if auth.needs_rehash(password_hash):
+        background_tasks.add_task(_upgrade_password_hash, user["id"], request.password)
+
     # @@@ Auto-fork system decks if user has no decks yet (handles existing users)
-    user_decks = database.get_user_decks(user["id"])
+    user_decks = await asyncio.to_thread(database.get_user_decks, user["id"])
     if len(user_decks) == 0:
-        database.auto_fork_system_decks(user["id"])
+        await asyncio.to_thread(database.auto_fork_system_decks, user["id"])
 
     # Generate token
     token = auth.create_access_token(user["id"], user["email"])
@@ -1118,8 +1291,6 @@ def import_local_data(
 
     Extracts sessions, pictures, preferences, and reports from localStorage export.
     """
-    import json
-
     user_id = current_user["user_id"]
 
     print(f"\n🔍 Migration request for user {user_id}:")
@@ -1142,7 +1313,7 @@ def import_local_data(
     # 1. Current session
     if request.currentSession:
         try:
-            current = json.loads(request.currentSession)
+            current = _json_loads(request.currentSession)
             sessions.append(
                 {
                     "id": "current-session",
@@ -1150,7 +1321,7 @@ def import_local_data(
                     "editor_state": current,
                 }
             )
-            print(f"✅ Imported current session ({len(str(current))} chars)")
+            print(f"✅ Imported current session ({len(request.currentSession)} chars)")
         except Exception as e:
             print(f"❌ Failed to parse current session: {e}")
             # Don't silently fail - this is critical data!
@@ -1158,10 +1329,9 @@ def import_local_data(
     # 2. Calendar entries
     if request.calendarEntries:
         try:
-            calendar = json.loads(request.calendarEntries)
+            calendar = _json_loads(request.calendarEntries)
             print(f"📅 Parsed calendar with {len(calendar)} dates")
             for date, entries in calendar.items():
-                print(f"  - {date}: {len(entries)} entries")
                 for entry in entries:
                     sessions.append(
                         {
@@ -1179,7 +1349,7 @@ def import_local_data(
     # 3. Old document (if exists)
     if request.oldDocument:
         try:
-            old_doc = json.loads(request.oldDocument)
+            old_doc = _json_loads(request.oldDocument)
             if old_doc and old_doc.get("document"):
                 sessions.append(
                     {
@@ -1197,7 +1367,7 @@ def import_local_data(
     pictures = []
     if request.dailyPictures:
         try:
-            pics = json.loads(request.dailyPictures)
+            pics = _json_loads(request.dailyPictures)
             for pic in pics:
                 pictures.append(
                     {
@@ -1213,7 +1383,7 @@ def import_local_data(
     preferences = {}
     if request.voiceCustomizations:
         try:
-            preferences["voice_configs"] = json.loads(request.voiceCustomizations)
+            preferences["voice_configs"] = _json_loads(request.voiceCustomizations)
         except:
             pass
 
@@ -1222,7 +1392,7 @@ def import_local_data(
 
     if request.stateConfig:
         try:
-            preferences["state_config"] = json.loads(request.stateConfig)
+            preferences["state_config"] = _json_loads(request.stateConfig)
         except:
             pass
 
@@ -1233,7 +1403,7 @@ def import_local_data(
     reports = []
     if request.analysisReports:
         try:
-            report_list = json.loads(request.analysisReports)
+            report_list = _json_loads(request.analysisReports)
             for report in report_list:
                 reports.append(
                     {
@@ -1302,8 +1472,6 @@ def import_calendar_recovery(
         "calendarEntries": "{\"2025-11-01\": [...]}"  # JSON string
     }
     """
-    import json
-
     user_id = current_user["user_id"]
     calendar_json = request.get("calendarEntries")
 
@@ -1312,10 +1480,9 @@ def import_calendar_recovery(
 
     sessions = []
     try:
-        calendar = json.loads(calendar_json)
+        calendar = _json_loads(calendar_json)
         print(f"📅 Recovery import: {len(calendar)} dates")
         for date, entries in calendar.items():
-            print(f"  - {date}: {len(entries)} entries")
             for entry in entries:
                 sessions.append(
                     {
@@ -1529,7 +1696,7 @@ def get_pictures(limit: int = 30, current_user: dict = Depends(get_current_user)
 
 
 @app.post("/api/pictures/generate")
-def generate_picture_endpoint(
+async def generate_picture_endpoint(
     request: GeneratePictureRequest,
     current_user: dict = Depends(get_current_user)
 ):
@@ -1537,10 +1704,14 @@ def generate_picture_endpoint(
     Generate a picture for a specific date.
     - If dry_run=True, returns the image but does not save.
     - If skip_if_exists=True, returns existing image without regenerating.
+
+    @@@ Generation waits on the image API for up to minutes. It runs on the
+    asyncio executor, not the request threadpool that every sync endpoint shares.
     """
     user_id = current_user["user_id"]
     tz = request.timezone or "Asia/Shanghai"
-    result = _generate_picture_for_date(
+    result = await asyncio.to_thread(
+        _generate_picture_for_date,
         user_id=user_id,
         target_date=request.target_date,
         timezone=tz,
@@ -1584,6 +1755,26 @@ def get_picture_full(date: str, current_user: dict = Depends(get_current_user)):
     return {"image_base64": full_image}
 
 
+@app.get("/api/pictures/{date}/image")
+def get_picture_image(date: str, current_user: dict = Depends(get_current_user)):
+    """
+    Full resolution image for a specific date as raw bytes.
+
+    Same picture as /api/pictures/{date}/full without the base64 wrapping
+    (~25% smaller, no decode on either side). Cacheable: a date's picture
+    only changes when it is regenerated.
+    """
+    image = database.get_daily_picture_bytes(current_user["user_id"], date)
+    if image is None:
+        raise HTTPException(status_code=404, detail="Picture not found for this date")
+
+    return Response(
+        content=image,
+        media_type=database.picture_media_type(image),
+        headers={"Cache-Control": "private, max-age=300"},
+    )
+
+
 @app.get("/api/friends/{friend_id}/pictures/{date}/full")
 def get_friend_picture_full_endpoint(
     friend_id: int, date: str, current_user: dict = Depends(get_current_user)
@@ -1621,7 +1812,10 @@ def save_picture(request: dict, current_user: dict = Depends(get_current_user)):
     if not date or not image_base64:
         raise HTTPException(status_code=400, detail="date and image_base64 required")
 
-    database.save_daily_picture(user_id, date, image_base64, prompt, thumbnail_base64)
+    try:
+        database.save_daily_picture(user_id, date, image_base64, prompt, thumbnail_base64)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return {"success": True}
 
 
@@ -1688,6 +1882,33 @@ def get_reports(limit: int = 10, current_user: dict = Depends(get_current_user))
     return {"reports": reports}
 
 
+@app.post("/api/reports/full")
+async def analyze_full_report(request: dict, current_user: dict = Depends(get_current_user)):
+    """
+    Run the echoes, traits and patterns analyses together.
+
+    Request body:
+    {
+        "language": "en" | "zh"  (optional)
+    }
+
+    @@@ Notes are loaded once and the three LLM calls run concurrently, so the
+    report takes as long as the slowest analysis instead of their sum
+    """
+    user_id = current_user["user_id"]
+    language_code = normalize_language_code(request.get("language"))
+
+    notes = await asyncio.to_thread(_load_all_notes_text, user_id)
+    if not notes.strip():
+        return {kind: [] for kind in _REPORT_ANALYSES}
+
+    print(f"📊 Full report analysis for user {user_id} (language: {language_code})")
+    results = await asyncio.gather(
+        *[asyncio.to_thread(_run_report_analysis, kind, notes, language_code) for kind in _REPORT_ANALYSES]
+    )
+    return dict(zip(_REPORT_ANALYSES, results))
+
+
 @app.post("/api/reports")
 def save_report(request: dict, current_user: dict = Depends(get_current_user)):
     """
@@ -1717,7 +1938,13 @@ def save_report(request: dict, current_user: dict = Depends(get_current_user)):
 @app.get("/api/default-voices")
 def get_default_voices():
     """Get default voice configurations"""
-    return config.VOICE_ARCHETYPES
+    return Response(content=config.VOICE_ARCHETYPES_JSON, media_type="application/json")
+
+
+@app.get("/api/cache/stats")
+def get_llm_cache_stats(current_user: dict = Depends(get_current_user)):
+    """Hit/miss counters and size of the in-memory LLM response cache."""
+    return llm_cache.stats()
 
 
 @app.post("/api/admin/trigger-timeline-generation")
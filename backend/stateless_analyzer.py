@@ -26,6 +26,20 @@ class SingleVoiceAnalysis(BaseModel):
     )
 
 
+def _format_voice_list(voice_archetypes: dict) -> str:
+    """Render voices as the "Available voices" block of the prompt."""
+    return "\n".join(
+        [
+            f"- ID: {key} | Name: {v.get('name', key)} | ({v['icon']}, {v['color']})\n  {v.get('systemPrompt', '')}"
+            for key, v in voice_archetypes.items()
+        ]
+    )
+
+
+# @@@ Default voices never change at runtime, so their prompt block is built once
+_DEFAULT_VOICE_LIST = _format_voice_list(config.VOICE_ARCHETYPES)
+
+
 def analyze_stateless(
     agent: PolyAgent,
     text: str,
@@ -65,13 +79,8 @@ def analyze_stateless(
     # Use provided voices or defaults
     voice_archetypes = voices or config.VOICE_ARCHETYPES
 
-    # Build voice list for prompt
-    voice_list = "\n".join(
-        [
-            f"- ID: {key} | Name: {v.get('name', key)} | ({v['icon']}, {v['color']})\n  {v.get('systemPrompt', '')}"
-            for key, v in voice_archetypes.items()
-        ]
-    )
+    # Build voice list for prompt (defaults are formatted once at import)
+    voice_list = _format_voice_list(voices) if voices else _DEFAULT_VOICE_LIST
 
     # Build existing conversation context
     conversation_context = ""
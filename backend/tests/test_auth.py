@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""Test password hashing and verification helpers."""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import asyncio
+import time
+import bcrypt
+import jwt
+import auth
+
+def test_verify_password():
+    print("🧪 Testing password verification...\n")
+
+    password_hash = auth.hash_password("test123").encode('utf-8')
+
+    assert auth.verify_password(b"test123", password_hash)
+    assert not auth.verify_password(b"test124", password_hash)
+    assert not auth.verify_password(b"test123", b"garbage")
+    print("✅ verify_password accepts the right password and rejects wrong ones")
+
+def test_rehash_if_needed():
+    print("🧪 Testing bcrypt cost upgrades...\n")
+
+    current = auth.hash_password("test123").encode('utf-8')
+    assert not auth.needs_rehash(current)
+    assert auth.rehash_if_needed(b"test123", current) is None
+
+    weak = bcrypt.hashpw(b"test123", bcrypt.gensalt(rounds=4))
+    assert auth.needs_rehash(weak)
+    upgraded = auth.rehash_if_needed(b"test123", weak)
+    assert upgraded.startswith("$2b$%02d$" % auth.BCRYPT_ROUNDS)
+    assert auth.verify_password(b"test123", upgraded.encode('utf-8'))
+    print("✅ Only hashes below BCRYPT_ROUNDS get rehashed")
+
+def test_bcrypt_rounds_config():
+    print("🧪 Testing BCRYPT_ROUNDS / BCRYPT_TARGET_MS parsing...\n")
+
+    assert auth._load_bcrypt_rounds({}) == 12
+    assert auth._load_bcrypt_rounds({"BCRYPT_ROUNDS": "10"}) == 10
+    for bad in ("abc", "3", "32"):
+        try:
+            auth._load_bcrypt_rounds({"BCRYPT_ROUNDS": bad})
+            assert False, f"BCRYPT_ROUNDS={bad} should be rejected"
+        except RuntimeError:
+            pass
+    for bad in ("fast", "0"):
+        try:
+            auth._load_bcrypt_rounds({"BCRYPT_TARGET_MS": bad})
+            assert False, f"BCRYPT_TARGET_MS={bad} should be rejected"
+        except RuntimeError:
+            pass
+
+    # An impossible budget still never drops below 10 rounds
+    assert auth._calibrate_rounds(0.001) == 10
+    assert auth._load_bcrypt_rounds({"BCRYPT_TARGET_MS": "0.001"}) == 10
+    print("✅ bcrypt cost settings are validated")
+
+def test_async_bcrypt_helpers():
+    print("🧪 Testing async bcrypt helpers...\n")
+
+    async def check():
+        password_hash = (await auth.ahash_password("test123")).encode('utf-8')
+        assert auth.verify_password(b"test123", password_hash)
+        assert await auth.averify_password(b"test123", password_hash)
+        assert not await auth.averify_password(b"test124", password_hash)
+        assert not await auth.averify_password(b"test123", b"garbage")
+
+    # Thread fallback, then the dedicated process pool
+    asyncio.run(check())
+    auth.start_bcrypt_pool()
+    try:
+        asyncio.run(check())
+    finally:
+        auth.shutdown_bcrypt_pool()
+    print("✅ ahash_password/averify_password agree with the sync versions")
+
+def test_verify_cache():
+    print("🧪 Testing verified-credentials cache...\n")
+
+    password_hash = bcrypt.hashpw(b"test123", bcrypt.gensalt(rounds=4))
+    key = auth._verify_cache_key(b"test123", password_hash)
+    auth.clear_verify_cache()
+
+    # Only successes are cached
+    assert not auth.verify_password(b"test124", password_hash)
+    assert len(auth._verified) == 0
+    assert auth.verify_password(b"test123", password_hash)
+    assert auth._is_verified(key)
+    assert auth.verify_password(b"test123", password_hash)
+
+    # Entries expire after the TTL
+    auth._verified[key] -= auth.VERIFY_CACHE_TTL_SECONDS
+    assert not auth._is_verified(key)
+
+    # LRU eviction keeps at most VERIFY_CACHE_SIZE entries
+    original_size = auth.VERIFY_CACHE_SIZE
+    auth.VERIFY_CACHE_SIZE = 2
+    try:
+        hashes = [bcrypt.hashpw(b"pw%d" % i, bcrypt.gensalt(rounds=4)) for i in range(3)]
+        for i, h in enumerate(hashes):
+            assert auth.verify_password(b"pw%d" % i, h)
+        assert len(auth._verified) == 2
+        assert not auth._is_verified(auth._verify_cache_key(b"pw0", hashes[0]))
+        assert auth._is_verified(auth._verify_cache_key(b"pw2", hashes[2]))
+
+        # VERIFY_CACHE_SIZE=0 disables the cache
+        auth.VERIFY_CACHE_SIZE = 0
+        auth.clear_verify_cache()
+        assert auth.verify_password(b"pw1", hashes[1])
+        assert len(auth._verified) == 0
+    finally:
+        auth.VERIFY_CACHE_SIZE = original_size
+        auth.clear_verify_cache()
+    print("✅ Cache stores successes only, expires, evicts and can be disabled")
+
+def test_access_tokens():
+    print("🧪 Testing JWT access tokens...\n")
+
+    token = auth.create_access_token(42, "test@example.com")
+    assert auth.verify_access_token(token) == {"user_id": 42, "email": "test@example.com"}
+
+    # Same wire format as PyJWT in both directions
+    decoded = jwt.decode(token, auth.SECRET_KEY, algorithms=["HS256"])
+    assert decoded["sub"] == "42" and decoded["exp"] > decoded["iat"]
+    now = int(time.time())
+    legacy = jwt.encode({"sub": "7", "email": "a@b.c", "exp": now + 60, "iat": now}, auth.SECRET_KEY, algorithm="HS256")
+    assert auth.verify_access_token(legacy) == {"user_id": 7, "email": "a@b.c"}
+
+    expired = jwt.encode({"sub": "7", "email": "a@b.c", "exp": now - 1}, auth.SECRET_KEY, algorithm="HS256")
+    wrong_key = jwt.encode({"sub": "7", "email": "a@b.c"}, "not-the-secret", algorithm="HS256")
+    unsigned = jwt.encode({"sub": "7", "email": "a@b.c"}, None, algorithm="none")
+    no_sub = jwt.encode({"email": "a@b.c"}, auth.SECRET_KEY, algorithm="HS256")
+    bad_sub = jwt.encode({"sub": "-1", "email": "a@b.c"}, auth.SECRET_KEY, algorithm="HS256")
+    for bad in (expired, wrong_key, unsigned, no_sub, bad_sub, token + "x", "a.b", "not a token"):
+        assert auth.verify_access_token(bad) is None, bad
+    print("✅ Tokens round-trip and bad tokens are rejected")
+
+def test_extract_token_from_header():
+    print("🧪 Testing Authorization header parsing...\n")
+
+    assert auth.extract_token_from_header("Bearer abc") == "abc"
+    assert auth.extract_token_from_header("bearer abc") == "abc"
+    assert auth.extract_token_from_header("BEARER  abc ") == "abc"
+    for bad in (None, "", "Bearer", "Bearer ", "Bearer    ", "Basic abc", "Bearerabc"):
+        assert auth.extract_token_from_header(bad) is None, bad
+    print("✅ Only Bearer tokens are extracted")
+
+if __name__ == "__main__":
+    test_verify_password()
+    test_rehash_if_needed()
+    test_bcrypt_rounds_config()
+    test_async_bcrypt_helpers()
+    test_verify_cache()
+    test_access_tokens()
+    test_extract_token_from_header()
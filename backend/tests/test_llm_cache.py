@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""Test the in-memory LLM response cache."""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_cache import LLMCache, cache_key
+
+def test_cache_key():
+    print("🧪 Testing LLM cache keys...\n")
+
+    assert cache_key(model="m", prompt="p") == cache_key(prompt="p", model="m")
+    assert cache_key(model="m", prompt="p") != cache_key(model="m", prompt="p2")
+    assert cache_key(kind="echoes", model="m", prompt="p") != cache_key(kind="traits", model="m", prompt="p")
+    print("✅ Keys are order-independent and cover every field")
+
+def test_get_or_call():
+    print("🧪 Testing LLM cache hits, TTL and eviction...\n")
+
+    cache = LLMCache(max_size=2, ttl_seconds=60)
+    calls = []
+
+    def call(value):
+        def run():
+            calls.append(value)
+            return value
+        return run
+
+    # Second lookup is a hit, only the first one calls through
+    assert cache.get_or_call("a", call("A")) == "A"
+    assert cache.get_or_call("a", call("other")) == "A"
+    assert calls == ["A"]
+
+    # Results rejected by the predicate (failures) are not cached
+    assert cache.get_or_call("b", call(None), cacheable=lambda v: v is not None) is None
+    assert cache.get_or_call("b", call("B"), cacheable=lambda v: v is not None) == "B"
+    assert calls == ["A", None, "B"]
+
+    # LRU eviction keeps at most max_size entries ("a" was used least recently)
+    cache.get_or_call("c", call("C"))
+    assert cache.get("a") == (False, None)
+    assert cache.get("c") == (True, "C")
+
+    # Entries expire after the TTL
+    expiry, value = cache._entries["c"]
+    cache._entries["c"] = (expiry - 60, value)
+    assert cache.get("c") == (False, None)
+
+    stats = cache.stats()
+    assert stats["hits"] == 2 and stats["size"] == 1, stats
+    print("✅ Cache hits, skips failures, evicts and expires")
+
+def test_disabled_cache():
+    print("🧪 Testing disabled LLM cache...\n")
+
+    for cache in (LLMCache(max_size=0, ttl_seconds=60), LLMCache(max_size=8, ttl_seconds=0)):
+        assert cache.get_or_call("a", lambda: 1) == 1
+        assert cache.get_or_call("a", lambda: 2) == 2
+        assert cache.stats()["size"] == 0
+    print("✅ Size or TTL of 0 turns the cache off")
+
+if __name__ == "__main__":
+    test_cache_key()
+    test_get_or_call()
+    test_disabled_cache()
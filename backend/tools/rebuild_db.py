@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Rewrite the database file with VACUUM, applying the configured page size.
+
+New databases are created with database.PAGE_SIZE; older files keep the page
+size they were created with until rebuilt here. Stop the server and the
+scheduler first - the rebuild needs exclusive access.
+"""
+
+from __future__ import annotations
+
+import argparse
+
+import database
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="VACUUM the database, applying a new page size.")
+    parser.add_argument(
+        "--page-size",
+        type=int,
+        default=database.PAGE_SIZE,
+        help=f"Page size in bytes (default: {database.PAGE_SIZE})",
+    )
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = parse_args()
+    print(f"Rebuilding {database.DB_PATH} ...")
+    result = database.rebuild_db_file(args.page_size)
+    print(f"Page size {result['old_page_size']} -> {result['page_size']} bytes.")
+
+
+if __name__ == "__main__":
+    main()
@@ -301,6 +301,29 @@ export async function analyzePatterns(): Promise<any[]> {
   return data.result?.patterns || [];
 }
 
+/**
+ * Run echoes, traits and patterns analyses in one request
+ * (backend loads notes once and runs the three LLM calls concurrently)
+ */
+export async function analyzeFullReport(): Promise<{ echoes: any[]; traits: any[]; patterns: any[] }> {
+  const response = await fetch(`${API_BASE}/api/reports/full`, {
+    method: 'POST',
+    headers: getAuthHeaders(),
+    body: JSON.stringify({ language: getUILanguage() })
+  });
+
+  if (!response.ok) {
+    throw new Error(`Report analysis failed: ${response.status}`);
+  }
+
+  const data = await response.json();
+  return {
+    echoes: data.echoes || [],
+    traits: data.traits || [],
+    patterns: data.patterns || []
+  };
+}
+
 /**
  * Generate a daily picture based on user's notes (PolyCLI direct call)
  */
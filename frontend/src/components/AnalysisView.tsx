@@ -1,6 +1,6 @@
 import { useState, useEffect } from 'react';
 import { useTranslation } from 'react-i18next';
-import { analyzeEchoes, analyzeTraits, analyzePatterns, saveAnalysisReport, getAnalysisReports } from '../api/voiceApi';
+import { analyzeFullReport, saveAnalysisReport, getAnalysisReports } from '../api/voiceApi';
 import { useAuth } from '../contexts/AuthContext';
 import { STORAGE_KEYS } from '../constants/storageKeys';
 import { getDateLocale } from '../i18n';
@@ -148,48 +148,23 @@ export default function AnalysisView() {
 
     setError('');
 
-    // @@@ Capture results to save to localStorage (state updates are async!)
+    // @@@ One request: backend loads notes once and runs all three analyses concurrently
+    // (captured locally to save below - state updates are async!)
     let echoesResult: Echo[] = [];
     let traitsResult: Trait[] = [];
     let patternsResult: Pattern[] = [];
 
-    // @@@ Helper to wrap analysis calls with loading state and error handling
-    const analyzeWithState = <T,>(
-      analyzeFn: () => Promise<T>,
-      loadingKey: 'echoes' | 'traits' | 'patterns',
-      onSuccess: (result: T) => void
-    ) => {
-      setLoading(prev => ({ ...prev, [loadingKey]: true }));
-      return analyzeFn()
-        .then(result => {
-          onSuccess(result);
-          return result;
-        })
-        .catch(err => {
-          console.error(`Failed to analyze ${loadingKey}:`, err);
-          return [] as T;
-        })
-        .finally(() => setLoading(prev => ({ ...prev, [loadingKey]: false })));
-    };
-
-    // Analyze all three in parallel
-    [echoesResult, traitsResult, patternsResult] = await Promise.all([
-      analyzeWithState(
-        () => analyzeEchoes(),
-        'echoes',
-        result => setEchoes(result)
-      ),
-      analyzeWithState(
-        () => analyzeTraits(),
-        'traits',
-        result => setTraits(result)
-      ),
-      analyzeWithState(
-        () => analyzePatterns(),
-        'patterns',
-        result => setPatterns(result)
-      )
-    ]);
+    setLoading({ echoes: true, traits: true, patterns: true });
+    try {
+      ({ echoes: echoesResult, traits: traitsResult, patterns: patternsResult } = await analyzeFullReport());
+      setEchoes(echoesResult);
+      setTraits(traitsResult);
+      setPatterns(patternsResult);
+    } catch (err) {
+      console.error('Failed to analyze reports:', err);
+    } finally {
+      setLoading({ echoes: false, traits: false, patterns: false });
+    }
 
     // @@@ Save report to database if authenticated, localStorage if guest
     const newReport: AnalysisReport = {
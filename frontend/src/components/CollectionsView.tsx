@@ -25,6 +25,12 @@ type TimelinePicture = {
   prompt: string;
 };
 
+// @@@ Base64 magic prefixes: PNG (\x89PNG) and WebP (RIFF) - everything else is JPEG
+function imageDataUrl(base64?: string): string {
+  const mime = base64?.startsWith('iVBOR') ? 'png' : base64?.startsWith('UklGR') ? 'webp' : 'jpeg';
+  return `data:image/${mime};base64,${base64}`;
+}
+
 interface TimelineEntryData {
   picture?: TimelinePicture;
   comments: Commentor[];
@@ -324,7 +330,7 @@ function TimelineCard({
         {dayData?.picture ? (
           <div style={{ position: 'relative' }}>
             <img
-              src={`data:image/${dayData.picture.base64?.startsWith('iVBOR') ? 'png' : 'jpeg'};base64,${dayData.picture.base64}`}
+              src={imageDataUrl(dayData.picture.base64)}
               alt={dayData.picture.prompt}
               style={{
                 width: isMobile ? '64px' : '72px',
@@ -1007,7 +1013,7 @@ function TimelinePage({ isVisible, voiceConfigs, dateLocale, timezone, isMobile
                 position: 'relative'
               }}>
                 <img
-                  src={`data:image/${(viewingImage.full_base64 || viewingImage.base64)?.startsWith('iVBOR') ? 'png' : 'jpeg'};base64,${viewingImage.full_base64 || viewingImage.base64}`}
+                  src={imageDataUrl(viewingImage.full_base64 || viewingImage.base64)}
                   alt="Generated image"
                   style={{
                     maxWidth: '100%',